@@ -0,0 +1,50 @@
+import sys
+from types import ModuleType
+from typing import Any
+
+import pytest
+
+
+class StubLangChainModel:
+    """Stand-in for LangChain model classes, so factories run without network."""
+
+    def __init__(self, **kwargs: Any):
+        self.kwargs = kwargs
+
+
+@pytest.fixture
+def stub_langchain(monkeypatch: pytest.MonkeyPatch):
+    """Replace the LangChain packages used by the factories with stub modules."""
+    lc_community = ModuleType("langchain_community")
+    chat_models = ModuleType("langchain_community.chat_models")
+    chat_models._module_lookup = {  # type: ignore[attr-defined]
+        "ChatOllama": "langchain_community.chat_models.ollama",
+        "ChatTongyi": "langchain_community.chat_models.tongyi",
+    }
+    chat_models.ChatOllama = StubLangChainModel  # type: ignore[attr-defined]
+    chat_models_tongyi = ModuleType("langchain_community.chat_models.tongyi")
+    chat_models_tongyi.ChatTongyi = StubLangChainModel  # type: ignore[attr-defined]
+    llms = ModuleType("langchain_community.llms")
+    llms.get_type_to_cls_dict = lambda: {  # type: ignore[attr-defined]
+        "ollama": lambda: StubLangChainModel,
+        "tongyi": lambda: StubLangChainModel,
+    }
+    llms_tongyi = ModuleType("langchain_community.llms.tongyi")
+    llms_tongyi.Tongyi = StubLangChainModel  # type: ignore[attr-defined]
+    lc_community.chat_models = chat_models  # type: ignore[attr-defined]
+    lc_community.llms = llms  # type: ignore[attr-defined]
+
+    lc_openai = ModuleType("langchain_openai")
+    for cls_name in ("ChatOpenAI", "AzureChatOpenAI", "OpenAI", "AzureOpenAI"):
+        setattr(lc_openai, cls_name, StubLangChainModel)
+
+    for module in (
+        lc_community,
+        chat_models,
+        chat_models_tongyi,
+        llms,
+        llms_tongyi,
+        lc_openai,
+    ):
+        monkeypatch.setitem(sys.modules, module.__name__, module)
+    return StubLangChainModel
@@ -0,0 +1,41 @@
+from typing import Any, Dict, List
+
+from lmconf.settings import LMConfig
+
+
+def make_config_list(size: int) -> List[Dict[str, Any]]:
+    providers = [
+        {
+            "provider": "ollama",
+            "model": "tinyllama",
+            "base_url": "http://localhost:11434",
+        },
+        {
+            "provider": "azure_openai",
+            "model": "gpt-35-turbo",
+            "api_version": "2023-05-15",
+            "base_url": "https://company-gpt.openai.azure.com",
+            "api_key": "sk-1234",
+        },
+        {"provider": "tongyi", "model": "qwen-turbo", "api_key": "sk-1234"},
+        {"provider": "openai", "model": "gpt-4", "api_key": "sk-1234"},
+    ]
+    return [
+        {"name": f"conf_{i}", "conf": dict(providers[i % len(providers)])}
+        for i in range(size)
+    ]
+
+
+def make_lm_config(size: int) -> LMConfig:
+    config_list = make_config_list(size)
+    last = config_list[-1]["name"]
+    return LMConfig.model_validate(
+        {
+            "config_list": config_list,
+            "x": {
+                "first": [config_list[0]["name"]],
+                "last": [last],
+                "last-override": [last, "override-model"],
+            },
+        }
+    )
@@ -0,0 +1,50 @@
+import json
+
+import pytest
+
+from benchmarks.factories import make_config_list
+from lmconf.cli import Report, load_version, main
+
+CONFIG_LIST_SIZES = [100, 1000]
+
+
+def write_env(path, config_list):
+    x = {"first": [config_list[0]["name"]], "last": [config_list[-1]["name"]]}
+    path.write_text(
+        f"LMCONF_lm_config__config_list='{json.dumps(config_list)}'\n"
+        f"LMCONF_lm_config__x='{json.dumps(x)}'\n"
+    )
+    return str(path)
+
+
+@pytest.fixture(params=CONFIG_LIST_SIZES)
+def versions(tmp_path, request: pytest.FixtureRequest):
+    config_list = make_config_list(request.param)
+    old = write_env(tmp_path / "old.env", config_list)
+    snapshot = str(tmp_path / "snapshot.json")
+    assert main(["validate", old, "--snapshot", snapshot]) == 0
+    config_list[-1] = {**config_list[-1], "conf": {"provider": "openai", "model": "x"}}
+    new = write_env(tmp_path / "new.env", config_list)
+    return old, snapshot, new
+
+
+def test_validate(benchmark, versions):
+    _, _, new = versions
+    report = benchmark(lambda: Report(load_version(new)))
+    assert report.ok
+
+
+@pytest.mark.parametrize("against", ["env", "snapshot"])
+def test_diff(benchmark, versions, against):
+    old, snapshot, new = versions
+    old = snapshot if against == "snapshot" else old
+    report = benchmark(lambda: Report(load_version(new), load_version(old)))
+    assert report.ok and report.n_validated == 1
+
+
+def test_diff_compile(benchmark, versions):
+    _, snapshot, new = versions
+    lm_config = benchmark(
+        lambda: Report(load_version(new), load_version(snapshot)).compile()
+    )
+    assert len(lm_config["config_list"]) == len(load_version(new).confs)
@@ -0,0 +1,46 @@
+import pytest
+
+from benchmarks.factories import make_lm_config
+
+CONFIG_LIST_SIZES = [1, 10, 100, 1000]
+
+
+@pytest.mark.parametrize("size", CONFIG_LIST_SIZES)
+def test_get_by_functionality(benchmark, size):
+    lm_config = make_lm_config(size)
+
+    conf = benchmark(lm_config.get, "last")
+    assert conf is lm_config.config_list[-1]["conf"]
+
+
+@pytest.mark.parametrize("size", CONFIG_LIST_SIZES)
+def test_get_by_named_config(benchmark, size):
+    lm_config = make_lm_config(size)
+    named_config = lm_config.config_list[-1]["name"]
+
+    conf = benchmark(lm_config.get, named_config=named_config)
+    assert conf is lm_config.config_list[-1]["conf"]
+
+
+@pytest.mark.parametrize("size", CONFIG_LIST_SIZES)
+def test_get_with_model_override(benchmark, size):
+    lm_config = make_lm_config(size)
+
+    conf = benchmark(lm_config.get, "last-override")
+    assert conf.model == "override-model"
+
+
+@pytest.mark.parametrize("named_config", ["conf_0", "conf_1", "conf_2", "conf_3"])
+def test_create_langchain_chatmodel(benchmark, stub_langchain, named_config):
+    conf = make_lm_config(4).get(named_config=named_config)
+
+    chat_model = benchmark(conf.create_langchain_chatmodel, temperature=0.1)
+    assert isinstance(chat_model, stub_langchain)
+
+
+@pytest.mark.parametrize("named_config", ["conf_0", "conf_1", "conf_2", "conf_3"])
+def test_create_langchain_llm(benchmark, stub_langchain, named_config):
+    conf = make_lm_config(4).get(named_config=named_config)
+
+    llm = benchmark(conf.create_langchain_llm, temperature=0.1)
+    assert isinstance(llm, stub_langchain)
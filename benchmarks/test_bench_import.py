@@ -0,0 +1,19 @@
+import subprocess
+import sys
+
+
+def _import_lmconf():
+    subprocess.run([sys.executable, "-c", "import lmconf"], check=True)
+
+
+def _start_interpreter():
+    subprocess.run([sys.executable, "-c", "pass"], check=True)
+
+
+def test_interpreter_startup(benchmark):
+    """Baseline for `test_import_lmconf`, the difference is the import time."""
+    benchmark.pedantic(_start_interpreter, rounds=10, warmup_rounds=1)
+
+
+def test_import_lmconf(benchmark):
+    benchmark.pedantic(_import_lmconf, rounds=10, warmup_rounds=1)
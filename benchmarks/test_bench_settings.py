@@ -0,0 +1,82 @@
+import json
+import os
+
+import pytest
+from pydantic_settings import BaseSettings, SettingsConfigDict
+
+from benchmarks.factories import make_config_list
+from lmconf import EnvCacheSettingsMixin, LMConfSettings, env_cache_settings
+
+
+class Settings(BaseSettings, LMConfSettings, EnvCacheSettingsMixin):
+    foo: str = ""
+
+    model_config = SettingsConfigDict(
+        env_file=".env",
+        env_prefix="lmconfbench_",
+        env_nested_delimiter="__",
+    )
+
+
+ENVIRON_SIZES = [100, 1000, 10000]
+CONFIG_LIST_SIZES = [10, 100]
+
+
+@pytest.fixture
+def large_environ(monkeypatch: pytest.MonkeyPatch, request: pytest.FixtureRequest):
+    for i in range(request.param):
+        monkeypatch.setenv(f"UNRELATED_BENCH_VAR_{i}", "x" * 32)
+    return request.param
+
+
+@pytest.fixture
+def dotenv_dir(
+    tmp_path, monkeypatch: pytest.MonkeyPatch, request: pytest.FixtureRequest
+):
+    config_list = make_config_list(request.param)
+    x = {"chatbot": [config_list[0]["name"]]}
+    (tmp_path / ".env").write_text(
+        f"lmconfbench_foo=bar\n"
+        f"lmconfbench_lm_config__config_list='{json.dumps(config_list)}'\n"
+        f"lmconfbench_lm_config__x='{json.dumps(x)}'\n"
+    )
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def empty_env_cache(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(env_cache_settings, "_FROM_ENV_CACHE", {})
+
+
+@pytest.mark.parametrize("large_environ", ENVIRON_SIZES, indirect=True)
+def test_get_current_settings_cache_hit(benchmark, empty_env_cache, large_environ):
+    settings = Settings.get_current_settings()
+
+    assert benchmark(Settings.get_current_settings) is settings
+
+
+@pytest.mark.parametrize("large_environ", ENVIRON_SIZES, indirect=True)
+def test_get_current_settings_cache_miss(benchmark, empty_env_cache, large_environ):
+    def get_current_settings():
+        env_cache_settings._FROM_ENV_CACHE.clear()
+        return Settings.get_current_settings()
+
+    assert benchmark(get_current_settings).foo == ""
+
+
+@pytest.mark.parametrize("dotenv_dir", CONFIG_LIST_SIZES, indirect=True)
+def test_settings_from_dotenv(benchmark, dotenv_dir):
+    settings = benchmark(Settings)
+    assert settings.foo == "bar"
+    assert settings.lm_config.get("chatbot").provider == "ollama"
+
+
+def test_settings_from_environ(benchmark, monkeypatch: pytest.MonkeyPatch):
+    config_list = make_config_list(100)
+    monkeypatch.setenv("lmconfbench_lm_config__config_list", json.dumps(config_list))
+    monkeypatch.setenv("lmconfbench_lm_config__x", json.dumps({"chatbot": ["conf_0"]}))
+    assert not os.path.exists(".env")
+
+    settings = benchmark(Settings)
+    assert len(settings.lm_config.config_list) == 100
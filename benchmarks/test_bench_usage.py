@@ -0,0 +1,10 @@
+from lmconf.usage import UsageAggregator
+
+KEY = ("rag", "azure_us", "gpt-4")
+
+
+def test_record(benchmark):
+    aggregator = UsageAggregator()
+
+    benchmark(aggregator.record, KEY, 12, 34, 0.5)
+    assert aggregator.collect()[0]["prompt_tokens"] > 0
@@ -2,9 +2,12 @@ from ._version import __version__  # noqa: F401
 
 from .settings import LMConfSettings  # noqa: F401
 from .env_cache_settings import EnvCacheSettingsMixin  # noqa: F401
+from .fork import after_fork, prepare_for_fork  # noqa: F401
 
 
 __all__ = [
     "LMConfSettings",
     "EnvCacheSettingsMixin",
+    "prepare_for_fork",
+    "after_fork",
 ]
@@ -0,0 +1,5 @@
+import sys
+
+from lmconf.cli import main
+
+sys.exit(main())
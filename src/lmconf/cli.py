@@ -0,0 +1,410 @@
+"""
+Validates the `lm_config` of a `.env` file or a JSON dump of the environment, and
+reports the changes between two versions:
+
+    python -m lmconf validate .env
+    python -m lmconf diff old.env new.env --snapshot lm_config.snapshot.json
+"""
+
+import argparse
+import json
+import sys
+from pathlib import Path
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Set, Tuple
+
+from pydantic import TypeAdapter, ValidationError
+
+from lmconf.settings import NamedFunctionality, NamedLLMConf
+from lmconf.snapshot import is_snapshot, write_snapshot
+
+try:
+    from dotenv import dotenv_values
+except ImportError as exc:
+    raise ImportError(
+        "Could not import dotenv python package. "
+        "Please install it with `pip install lmconf[demo]`."
+    ) from exc
+
+FIELD_NAME = "lm_config"
+_NAMED_CONF_ADAPTER: TypeAdapter = TypeAdapter(NamedLLMConf)
+_FUNCTIONALITY_ADAPTER: TypeAdapter = TypeAdapter(NamedFunctionality)
+
+
+class _Version:
+    """The `lm_config` value of a file, with its entries by name."""
+
+    def __init__(self, source: Any, validated: Optional[Dict[str, Any]] = None):
+        self.source = source
+        # validated form of the entries, for a snapshot
+        self.validated = validated
+        self._validated_confs: Optional[Dict[str, Any]] = None
+        self.errors: List[str] = []
+        self.warnings: List[str] = []
+        self.confs: Dict[str, Any] = {}
+        # where the entries are reported, by name
+        self.locations: Dict[str, str] = {}
+        # entries whose name is already used, with their location
+        self.duplicates: List[Tuple[str, Any]] = []
+        self.functionalities: Dict[str, Any] = {}
+
+        if not isinstance(source, dict):
+            self.errors.append(f"{FIELD_NAME}: must be a JSON object")
+            return
+        config_list = source.get("config_list", [])
+        if not isinstance(config_list, list):
+            self.errors.append(f"{FIELD_NAME}.config_list: must be a JSON array")
+            config_list = []
+        for i, entry in enumerate(config_list):
+            name = entry.get("name") if isinstance(entry, dict) else None
+            if isinstance(name, str):
+                location = f"config_list.{name}"
+            else:
+                name = location = f"config_list[{i}]"
+            if name in self.confs:
+                # like `LMConfig.build_index`, the first entry is used
+                self.warnings.append(
+                    f"{FIELD_NAME}.config_list: duplicate name {name}, "
+                    "the first entry is used"
+                )
+                self.duplicates.append((f"config_list[{i}]", entry))
+                continue
+            self.confs[name] = entry
+            self.locations[name] = location
+        x = source.get("x", {})
+        if not isinstance(x, dict):
+            self.errors.append(f"{FIELD_NAME}.x: must be a JSON object")
+            x = {}
+        self.functionalities = x
+
+    def validated_conf(self, name: str) -> Optional[Any]:
+        if self.validated is None:
+            return None
+        if self._validated_confs is None:
+            self._validated_confs = {
+                named_conf["name"]: named_conf
+                for named_conf in self.validated["config_list"]
+            }
+        return self._validated_confs.get(name)
+
+
+def _deep_update(mapping: Dict[str, Any], updating: Dict[str, Any]) -> Dict[str, Any]:
+    updated = mapping.copy()
+    for key, value in updating.items():
+        if isinstance(updated.get(key), dict) and isinstance(value, dict):
+            value = _deep_update(updated[key], value)
+        updated[key] = value
+    return updated
+
+
+def split_env_vars(
+    env_vars: Mapping[str, Optional[str]], key: str, delimiter: Optional[str]
+) -> Dict[Tuple[str, ...], str]:
+    """Returns the `key` and `key{delimiter}*` variables, by their path under `key`."""
+    nested_prefix = key + delimiter if delimiter else None
+    taken: Dict[Tuple[str, ...], str] = {}
+    for env_name, env_value in env_vars.items():
+        if env_value is None or not env_name.startswith(key):
+            continue
+        if env_name == key:
+            taken[()] = env_value
+        elif nested_prefix and env_name.startswith(nested_prefix):
+            taken[tuple(env_name[len(nested_prefix) :].split(delimiter))] = env_value
+    return taken
+
+
+def assemble(raw_values: Mapping[Tuple[str, ...], str], field_name: str) -> Any:
+    """
+    Decodes and merges the values split by `split_env_vars` like `EnvSettingsSource`,
+    without validating. Nested keys override the whole value.
+    """
+    data: Any = {}
+    for path in sorted(raw_values, key=len):
+        try:
+            value = json.loads(raw_values[path])
+        except ValueError as exc:
+            raise ValueError(f'error parsing value for field "{field_name}"') from exc
+        for key in reversed(path):
+            value = {key: value}
+        if path and isinstance(data, dict):
+            data = _deep_update(data, value)
+        else:
+            data = value
+    return data
+
+
+def _read_env(path: str) -> Dict[str, Any]:
+    if Path(path).suffix == ".json":
+        data = json.loads(Path(path).read_text(encoding="utf-8"))
+        if not isinstance(data, dict):
+            raise ValueError(f"{path}: must be a JSON object of environment variables")
+        return data
+    return dotenv_values(path)
+
+
+def _detect_env_prefix(env_vars: Dict[str, Any], delimiter: str) -> str:
+    prefixes = set()
+    for env_name in env_vars:
+        i = env_name.find(FIELD_NAME)
+        if i < 0:
+            continue
+        rest = env_name[i + len(FIELD_NAME) :]
+        if not rest or rest.startswith(delimiter):
+            prefixes.add(env_name[:i])
+    if len(prefixes) > 1:
+        raise ValueError(
+            f"several env prefixes found: {', '.join(sorted(prefixes))}, "
+            "select one with --env-prefix"
+        )
+    if not prefixes:
+        raise ValueError(f"no {FIELD_NAME} variables found")
+    return prefixes.pop()
+
+
+def load_version(
+    path: str, env_prefix: Optional[str] = None, delimiter: str = "__"
+) -> _Version:
+    """Reads the `lm_config` value of a `.env` file, an env dump or a snapshot."""
+    env_vars = _read_env(path)
+    if is_snapshot(env_vars):
+        return _Version(env_vars["source"], env_vars["lm_config"])
+
+    # like `EnvSettingsSource`, which is not case sensitive by default
+    env_vars = {
+        env_name.lower(): value if isinstance(value, str) else json.dumps(value)
+        for env_name, value in env_vars.items()
+        if value is not None
+    }
+    if env_prefix is None:
+        env_prefix = _detect_env_prefix(env_vars, delimiter)
+    raw_values = split_env_vars(env_vars, (env_prefix + FIELD_NAME).lower(), delimiter)
+    if not raw_values:
+        raise ValueError(f"no {env_prefix}{FIELD_NAME} variables found")
+    return _Version(assemble(raw_values, FIELD_NAME))
+
+
+def _diff(old: Dict[str, Any], new: Dict[str, Any]) -> Dict[str, List[str]]:
+    return {
+        "added": [name for name in new if name not in old],
+        "changed": [name for name in new if name in old and old[name] != new[name]],
+        "removed": [name for name in old if name not in new],
+    }
+
+
+def _targets(functionality: Any) -> Set[str]:
+    tiers = (
+        functionality.get("tiers", [])
+        if isinstance(functionality, dict)
+        else [functionality]
+    )
+    return {
+        tier[0]
+        for tier in tiers
+        if isinstance(tier, list) and tier and isinstance(tier[0], str)
+    }
+
+
+def _format_error(where: str, exc: ValidationError) -> List[str]:
+    return [
+        f"{where}: {'.'.join(str(loc) for loc in error['loc']) or '<value>'}: "
+        f"{error['msg']}"
+        for error in exc.errors()
+    ]
+
+
+class Report:
+    """The outcome of validating a version of `lm_config`, against an older one."""
+
+    def __init__(self, new: _Version, old: Optional[_Version] = None):
+        self.errors = list(new.errors)
+        self.warnings = list(new.warnings)
+        self.n_validated = 0
+        self.conf_changes = _diff(old.confs if old else {}, new.confs)
+        self.functionality_changes = _diff(
+            old.functionalities if old else {}, new.functionalities
+        )
+        # unchanged functionalities whose targets changed
+        changed_targets = set(
+            self.conf_changes["changed"] + self.conf_changes["removed"]
+        )
+        self.affected: Dict[str, List[str]] = {}
+        if old is not None:
+            touched = set(
+                self.functionality_changes["added"]
+                + self.functionality_changes["changed"]
+            )
+            for name, functionality in new.functionalities.items():
+                targets = _targets(functionality) & changed_targets
+                if name not in touched and targets:
+                    self.affected[name] = sorted(targets)
+
+        self.source = new.source
+        self._new, self._old = new, old
+        self._validated_confs: Dict[str, Any] = {}
+        self._validated_functionalities: Dict[str, Any] = {}
+        self._validate(self.conf_changes["added"] + self.conf_changes["changed"])
+        # not used, but validated by `LMConfig` all the same
+        for location, entry in new.duplicates:
+            try:
+                _NAMED_CONF_ADAPTER.validate_python(entry)
+            except ValidationError as exc:
+                self.errors.extend(_format_error(location, exc))
+        self._validate_functionalities(
+            self.functionality_changes["added"] + self.functionality_changes["changed"]
+        )
+        for name, functionality in new.functionalities.items():
+            for target in sorted(_targets(functionality) - set(new.confs)):
+                self.errors.append(
+                    f"x.{name}: {target} not found in {FIELD_NAME}.config_list"
+                )
+
+    def _validate(self, names: Sequence[str]) -> None:
+        for name in names:
+            self.n_validated += 1
+            try:
+                named_conf = _NAMED_CONF_ADAPTER.validate_python(self._new.confs[name])
+            except ValidationError as exc:
+                self.errors.extend(_format_error(self._new.locations[name], exc))
+                continue
+            self._validated_confs[name] = _NAMED_CONF_ADAPTER.dump_python(
+                named_conf, mode="json"
+            )
+
+    def _validate_functionalities(self, names: Sequence[str]) -> None:
+        for name in names:
+            self.n_validated += 1
+            try:
+                functionality = _FUNCTIONALITY_ADAPTER.validate_python(
+                    self._new.functionalities[name]
+                )
+            except ValidationError as exc:
+                self.errors.extend(_format_error(f"x.{name}", exc))
+                continue
+            self._validated_functionalities[name] = _FUNCTIONALITY_ADAPTER.dump_python(
+                functionality, mode="json"
+            )
+
+    @property
+    def ok(self) -> bool:
+        return not self.errors
+
+    def compile(self) -> Dict[str, Any]:
+        """
+        Returns the validated `lm_config` value. The unchanged entries are taken from
+        the older version when it is a snapshot, otherwise they are validated now.
+        """
+        old = self._old
+        for name in self._new.confs:
+            if name in self._validated_confs:
+                continue
+            validated = old.validated_conf(name) if old else None
+            if validated is not None:
+                self._validated_confs[name] = validated
+            else:
+                self._validate([name])
+        for name in self._new.functionalities:
+            if name in self._validated_functionalities:
+                continue
+            if old is not None and old.validated is not None:
+                self._validated_functionalities[name] = old.validated["x"][name]
+            else:
+                self._validate_functionalities([name])
+        return {
+            "x": {
+                name: self._validated_functionalities[name]
+                for name in self._new.functionalities
+                if name in self._validated_functionalities
+            },
+            "config_list": [
+                self._validated_confs[name]
+                for name in self._new.confs
+                if name in self._validated_confs
+            ],
+        }
+
+    def lines(self) -> List[str]:
+        lines = []
+        if self._old is not None:
+            for title, changes in (
+                ("config_list", self.conf_changes),
+                ("x", self.functionality_changes),
+            ):
+                lines.append(
+                    f"{title}: {len(changes['added'])} added, "
+                    f"{len(changes['changed'])} changed, "
+                    f"{len(changes['removed'])} removed"
+                )
+                for mark, kind in (("+", "added"), ("~", "changed"), ("-", "removed")):
+                    lines.extend(f"  {mark} {name}" for name in changes[kind])
+                if title == "x":
+                    lines.extend(
+                        f"  ~ {name} (via {', '.join(targets)})"
+                        for name, targets in self.affected.items()
+                    )
+        n_entries = len(self._new.confs) + len(self._new.functionalities)
+        lines.append(f"validated {self.n_validated} of {n_entries} entries")
+        return lines
+
+
+def _parser() -> argparse.ArgumentParser:
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument(
+        "--env-prefix",
+        help="prefix of the lm_config variables, detected when not specified",
+    )
+    common.add_argument("--env-nested-delimiter", default="__")
+    common.add_argument(
+        "--snapshot",
+        metavar="PATH",
+        help="write the validated lm_config, see `lmconf.snapshot.load_snapshot`",
+    )
+
+    parser = argparse.ArgumentParser(
+        prog="python -m lmconf",
+        description="Validates the lm_config of .env files or JSON env dumps.",
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    validate = subparsers.add_parser(
+        "validate", parents=[common], help="validate all the entries of a file"
+    )
+    validate.add_argument("file")
+    diff = subparsers.add_parser(
+        "diff",
+        parents=[common],
+        help="report the changes between two files, validate the changed entries",
+    )
+    diff.add_argument("old", help="previous file or snapshot, assumed valid")
+    diff.add_argument("new")
+    return parser
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    args = _parser().parse_args(argv)
+    load_args: Tuple[Optional[str], str] = (
+        args.env_prefix,
+        args.env_nested_delimiter,
+    )
+    try:
+        if args.command == "diff":
+            report = Report(
+                load_version(args.new, *load_args), load_version(args.old, *load_args)
+            )
+        else:
+            report = Report(load_version(args.file, *load_args))
+    except (OSError, ValueError) as exc:
+        print(f"error: {exc}", file=sys.stderr)
+        return 1
+
+    if args.snapshot and report.ok:
+        # validates the unchanged entries, unless the old file is a snapshot
+        lm_config = report.compile()
+    for line in report.lines():
+        print(line)
+    for warning in report.warnings:
+        print(f"warning: {warning}", file=sys.stderr)
+    for error in report.errors:
+        print(f"error: {error}", file=sys.stderr)
+    if not report.ok:
+        return 1
+    if args.snapshot:
+        write_snapshot(args.snapshot, report.source, lm_config)
+    return 0
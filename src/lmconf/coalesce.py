@@ -0,0 +1,168 @@
+import functools
+import json
+from typing import Any, AsyncIterator, Dict, Iterator, Optional
+
+try:
+    from langchain_core.runnables import Runnable, RunnableConfig
+except ImportError as exc:
+    raise ImportError(
+        "Could not import langchain_core python package. "
+        "Please install it with `pip install lmconf[langchain]`."
+    ) from exc
+
+from lmconf.config import LLMConfBase
+from lmconf.fork import register_after_fork
+from lmconf.singleflight import AsyncSingleFlight, SingleFlight
+
+_SINGLE_FLIGHT = SingleFlight()
+_ASYNC_SINGLE_FLIGHT = AsyncSingleFlight()
+
+
+@register_after_fork
+def _reset_single_flights() -> None:
+    _SINGLE_FLIGHT.reset()
+    _ASYNC_SINGLE_FLIGHT.reset()
+
+
+def _model_dump(obj: Any) -> Any:
+    # LangChain messages and prompt values are pydantic models
+    if hasattr(obj, "model_dump"):
+        return obj.model_dump()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def _to_json(obj: Any) -> Any:
+    try:
+        return _model_dump(obj)
+    except TypeError:
+        return repr(obj)
+
+
+def _json_kwargs(kwargs: Dict[str, Any]) -> Dict[str, Any]:
+    # other arguments, e.g. callbacks, clients or rate limiters, differ per model
+    json_kwargs = {}
+    for name, value in kwargs.items():
+        try:
+            json.dumps(value, default=_model_dump)
+        except (TypeError, ValueError):
+            continue
+        json_kwargs[name] = value
+    return json_kwargs
+
+
+def _dumps(obj: Any) -> str:
+    return json.dumps(obj, sort_keys=True, default=_to_json)
+
+
+class CoalescedRunnable(Runnable):
+    """
+    Wraps a LangChain model so identical in-flight calls are sent once, and the
+    result is shared by all the callers. Calls are identical when the models are
+    created from the same configuration and arguments, and get the same input and
+    keyword arguments. Streams are shared chunk by chunk.
+
+    Only the first caller's `config` is used, e.g. the callbacks of the other callers
+    are not called. The other attributes of the model, e.g. `bind_tools`, are those of
+    the wrapped model, and the runnables its methods return are coalesced too.
+    """
+
+    def __init__(self, bound: Runnable, key: str):
+        self.bound = bound
+        self.key = key
+
+    def __getattr__(self, name: str) -> Any:
+        if name == "bound":  # not set yet, e.g. when unpickling
+            raise AttributeError(name)
+        attr = getattr(self.bound, name)
+        if not callable(attr):
+            return attr
+
+        @functools.wraps(attr)
+        def method(*args: Any, **kwargs: Any) -> Any:
+            result = attr(*args, **kwargs)
+            if isinstance(result, Runnable):
+                return CoalescedRunnable(result, _dumps([self.key, name, args, kwargs]))
+            return result
+
+        return method
+
+    @property
+    def InputType(self) -> Any:
+        return self.bound.InputType
+
+    @property
+    def OutputType(self) -> Any:
+        return self.bound.OutputType
+
+    def get_input_schema(self, config: Optional[RunnableConfig] = None) -> Any:
+        return self.bound.get_input_schema(config)
+
+    def get_output_schema(self, config: Optional[RunnableConfig] = None) -> Any:
+        return self.bound.get_output_schema(config)
+
+    def _call_key(self, method: str, input: Any, kwargs: Any) -> str:
+        return _dumps([self.key, method, input, kwargs])
+
+    def invoke(
+        self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any
+    ) -> Any:
+        return _SINGLE_FLIGHT.do(
+            self._call_key("invoke", input, kwargs),
+            self.bound.invoke,
+            input,
+            config,
+            **kwargs,
+        )
+
+    async def ainvoke(
+        self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any
+    ) -> Any:
+        return await _ASYNC_SINGLE_FLIGHT.do(
+            self._call_key("invoke", input, kwargs),
+            self.bound.ainvoke,
+            input,
+            config,
+            **kwargs,
+        )
+
+    def stream(
+        self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any
+    ) -> Iterator[Any]:
+        yield from _SINGLE_FLIGHT.stream(
+            self._call_key("stream", input, kwargs),
+            self.bound.stream,
+            input,
+            config,
+            **kwargs,
+        )
+
+    async def astream(
+        self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any
+    ) -> AsyncIterator[Any]:
+        async for chunk in _ASYNC_SINGLE_FLIGHT.stream(
+            self._call_key("stream", input, kwargs),
+            self.bound.astream,
+            input,
+            config,
+            **kwargs,
+        ):
+            yield chunk
+
+
+def _conf_key(conf: LLMConfBase, factory: str, kwargs: Dict[str, Any]) -> str:
+    return _dumps([conf.model_dump(mode="json"), factory, _json_kwargs(kwargs)])
+
+
+def create_coalesced_chatmodel(
+    conf: LLMConfBase, **chatmodel_kwargs: Any
+) -> CoalescedRunnable:
+    """`conf.create_langchain_chatmodel(...)` wrapped in a `CoalescedRunnable`."""
+    # before creating the model, factories may update the arguments
+    key = _conf_key(conf, "chatmodel", chatmodel_kwargs)
+    return CoalescedRunnable(conf.create_langchain_chatmodel(**chatmodel_kwargs), key)
+
+
+def create_coalesced_llm(conf: LLMConfBase, **llm_kwargs: Any) -> CoalescedRunnable:
+    """`conf.create_langchain_llm(...)` wrapped in a `CoalescedRunnable`."""
+    key = _conf_key(conf, "llm", llm_kwargs)
+    return CoalescedRunnable(conf.create_langchain_llm(**llm_kwargs), key)
@@ -1,4 +1,6 @@
-from typing import Optional
+from functools import lru_cache
+from types import ModuleType
+from typing import Callable, Dict, Optional
 from typing import TYPE_CHECKING
 
 from pydantic import BaseModel, Field
@@ -8,6 +10,21 @@ if TYPE_CHECKING:
     from langchain_core.language_models.llms import BaseLLM
 
 
+@lru_cache(maxsize=None)
+def _chat_model_cls_names(lccm: ModuleType) -> Dict[str, str]:
+    """Maps provider names to class names in `langchain_community.chat_models`."""
+    return {
+        _module.split(".")[-1]: cls_name
+        for cls_name, _module in lccm._module_lookup.items()
+    }
+
+
+@lru_cache(maxsize=None)
+def _llm_cls_getters(lcllms: ModuleType) -> Dict[str, Callable[[], type]]:
+    """Maps provider names to class getters in `langchain_community.llms`."""
+    return lcllms.get_type_to_cls_dict()
+
+
 class LLMConfBase(BaseModel):
     provider: str = Field(description='e.g. "ollama", "openai", "tongyi", "azure_openai"')
     model: str = Field(description="default model if not set")
@@ -40,10 +57,7 @@ class OpenAICompatibleLLMConf(LLMConfBase):
             ) from exc
         from langchain_community import chat_models as lccm
 
-        mapping_cls_name = {
-            _module.split(".")[-1]: cls_name
-            for cls_name, _module in lccm._module_lookup.items()
-        }
+        mapping_cls_name = _chat_model_cls_names(lccm)
         if self.provider == "openai":
             chat_model_cls = langchain_openai.ChatOpenAI
         elif self.provider == "azure_openai":
@@ -77,9 +91,9 @@ class OpenAICompatibleLLMConf(LLMConfBase):
                 "Please install it with `pip install lmconf[langchain]`."
             ) from exc
 
-        from langchain_community.llms import get_type_to_cls_dict
+        from langchain_community import llms as lcllms
 
-        lc_provider_to_cls_getter_mapper = get_type_to_cls_dict()
+        lc_provider_to_cls_getter_mapper = _llm_cls_getters(lcllms)
 
         if self.provider == "openai":
             llm_cls = langchain_openai.OpenAI
@@ -0,0 +1,189 @@
+import math
+import threading
+import time
+import weakref
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Iterable, List, NamedTuple, Optional
+
+from pydantic import BaseModel, Field, model_validator
+
+
+class FallbackChain(BaseModel):
+    """
+    Tiers of `[named_config, which_model]` for a functionality, preferred first.
+
+    The active tier moves down the chain when the p95 latency or the queue depth goes
+    above the `downgrade_*` thresholds, and back up when both are at or below the
+    `upgrade_*` thresholds, at most once per `cooldown_s` seconds.
+    """
+
+    tiers: List[List[str]] = Field(min_length=1)
+    downgrade_p95_latency_s: Optional[float] = None
+    upgrade_p95_latency_s: Optional[float] = Field(
+        default=None, description="defaults to half of downgrade_p95_latency_s"
+    )
+    downgrade_queue_depth: Optional[int] = None
+    upgrade_queue_depth: Optional[int] = Field(
+        default=None, description="defaults to half of downgrade_queue_depth"
+    )
+    window: int = Field(default=50, description="latencies kept for the p95")
+    min_samples: int = Field(default=10, description="latencies needed for the p95")
+    cooldown_s: float = Field(default=30.0, description="min time between changes")
+
+    @model_validator(mode="after")
+    def set_upgrade_thresholds(self):
+        if (
+            self.upgrade_p95_latency_s is None
+            and self.downgrade_p95_latency_s is not None
+        ):
+            self.upgrade_p95_latency_s = self.downgrade_p95_latency_s / 2
+        if self.upgrade_queue_depth is None and self.downgrade_queue_depth is not None:
+            self.upgrade_queue_depth = self.downgrade_queue_depth // 2
+        for upgrade, downgrade in (
+            (self.upgrade_p95_latency_s, self.downgrade_p95_latency_s),
+            (self.upgrade_queue_depth, self.downgrade_queue_depth),
+        ):
+            if upgrade is not None and downgrade is not None and upgrade > downgrade:
+                raise ValueError("upgrade thresholds must not exceed downgrade ones")
+        return self
+
+
+class _TierState:
+    def __init__(self, window: int):
+        self.tier = 0
+        self.latencies: Deque[float] = deque(maxlen=window)
+        self.queue_depth = 0
+        self.changed_at = -math.inf
+
+
+def _p95(latencies: Iterable[float]) -> float:
+    ordered = sorted(latencies)
+    return ordered[min(len(ordered) - 1, math.ceil(0.95 * len(ordered)) - 1)]
+
+
+class TierSelector:
+    """
+    Selects the active tier of the `FallbackChain` of each functionality from the
+    observed latencies and queue depths.
+
+    Latencies observed before a tier change are dropped, they were measured on the
+    previous tier, and so are the latencies measured on another tier than the active
+    one. Selectors are pickled and copied without their lock, so `LMConfig`
+    can be sent to other processes.
+    """
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic):
+        self.clock = clock
+        self._states: Dict[str, _TierState] = {}
+        self._lock = threading.Lock()
+        _SELECTORS.add(self)
+
+    def __getstate__(self) -> Dict[str, Any]:
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+        _SELECTORS.add(self)
+
+    def _state(self, functionality: str, chain: FallbackChain) -> _TierState:
+        if (state := self._states.get(functionality)) is None:
+            state = self._states.setdefault(functionality, _TierState(chain.window))
+        return state
+
+    def active_tier(self, functionality: str, chain: FallbackChain) -> int:
+        state = self._states.get(functionality)
+        return min(state.tier, len(chain.tiers) - 1) if state else 0
+
+    def observe_latency(
+        self,
+        functionality: str,
+        chain: FallbackChain,
+        latency_s: float,
+        tier: Optional[int] = None,
+    ) -> int:
+        """
+        Records the latency of a call sent to `tier`, the active one by default,
+        returns the active tier.
+        """
+        with self._lock:
+            state = self._state(functionality, chain)
+            if tier is not None and tier != min(state.tier, len(chain.tiers) - 1):
+                return state.tier
+            state.latencies.append(latency_s)
+            return self._evaluate(state, chain)
+
+    def observe_queue_depth(
+        self, functionality: str, chain: FallbackChain, queue_depth: int
+    ) -> int:
+        """Records the number of calls waiting, returns the active tier."""
+        with self._lock:
+            state = self._state(functionality, chain)
+            state.queue_depth = queue_depth
+            return self._evaluate(state, chain)
+
+    def _evaluate(self, state: _TierState, chain: FallbackChain) -> int:
+        now = self.clock()
+        if now - state.changed_at < chain.cooldown_s:
+            return state.tier
+
+        p95 = (
+            _p95(state.latencies) if len(state.latencies) >= chain.min_samples else None
+        )
+        overloaded, relieved = False, True
+        if chain.downgrade_p95_latency_s is not None:
+            overloaded |= p95 is not None and p95 > chain.downgrade_p95_latency_s
+            relieved &= p95 is not None and p95 <= chain.upgrade_p95_latency_s  # type: ignore[operator]
+        if chain.downgrade_queue_depth is not None:
+            overloaded |= state.queue_depth > chain.downgrade_queue_depth
+            relieved &= state.queue_depth <= chain.upgrade_queue_depth  # type: ignore[operator]
+        if (
+            chain.downgrade_p95_latency_s is None
+            and chain.downgrade_queue_depth is None
+        ):
+            relieved = False
+
+        if overloaded and state.tier < len(chain.tiers) - 1:
+            state.tier += 1
+        elif relieved and not overloaded and state.tier > 0:
+            state.tier -= 1
+        else:
+            return state.tier
+        state.changed_at = now
+        state.latencies.clear()
+        return state.tier
+
+
+_SELECTORS: "weakref.WeakSet[TierSelector]" = weakref.WeakSet()
+
+
+def _reset_locks_after_fork() -> None:
+    # registered by `lmconf.fork`, which imports the settings using this module
+    for selector in list(_SELECTORS):
+        selector._lock = threading.Lock()
+
+
+class SimulationStep(NamedTuple):
+    time: float
+    latency_s: Optional[float] = None
+    queue_depth: Optional[int] = None
+
+
+def simulate(chain: FallbackChain, steps: Iterable[SimulationStep]) -> List[int]:
+    """
+    Replays the observations of a functionality on a `TierSelector` with a simulated
+    clock, and returns the active tier after each step.
+    """
+    now = 0.0
+    selector = TierSelector(clock=lambda: now)
+    tiers = []
+    for step in steps:
+        now = step.time
+        if step.queue_depth is not None:
+            selector.observe_queue_depth("simulation", chain, step.queue_depth)
+        if step.latency_s is not None:
+            selector.observe_latency("simulation", chain, step.latency_s)
+        tiers.append(selector.active_tier("simulation", chain))
+    return tiers
@@ -0,0 +1,74 @@
+import os
+import sys
+from logging import getLogger
+from typing import Callable, List, TypeVar
+
+from lmconf import env_cache_settings, fallback
+from lmconf.config import _chat_model_cls_names, _llm_cls_getters
+from lmconf.settings import LMConfig
+
+TCallback = TypeVar("TCallback", bound=Callable[[], None])
+
+logger = getLogger(__name__)
+_AFTER_FORK_CALLBACKS: List[Callable[[], None]] = []
+
+# modules caching HTTP clients, the cached clients hold connection pools
+_HTTPX_CLIENT_CACHE_MODULES = ["langchain_openai.chat_models._client_utils"]
+
+
+def register_after_fork(callback: TCallback) -> TCallback:
+    """
+    Registers a callback resetting per-process state, called by `after_fork` in the
+    child process. Can be used as a decorator.
+    """
+    _AFTER_FORK_CALLBACKS.append(callback)
+    return callback
+
+
+def prepare_for_fork() -> None:
+    """
+    Builds the immutable state resolved from the configuration in the parent process,
+    so forked children share it copy-on-write instead of rebuilding it each.
+
+    That is the `config_list` indexes of the `LMConfig` of settings cached by
+    `EnvCacheSettingsMixin`, and the provider class registries of the LangChain
+    packages already imported. It is cheap to call again when nothing changed.
+    """
+    for settings in list(env_cache_settings._FROM_ENV_CACHE.values()):
+        lm_config = getattr(settings, "lm_config", None)
+        if isinstance(lm_config, LMConfig):
+            lm_config.build_index()
+
+    # don't import LangChain packages here, the parent may never use them
+    if (lccm := sys.modules.get("langchain_community.chat_models")) is not None:
+        _chat_model_cls_names(lccm)
+    if (lcllms := sys.modules.get("langchain_community.llms")) is not None:
+        _llm_cls_getters(lcllms)
+
+
+def after_fork() -> None:
+    """
+    Resets the per-process state in a forked child process.
+
+    The HTTP clients cached by the LangChain packages are dropped, so the connection
+    pools are rebuilt lazily by the first model created in the child. Models created
+    before fork keep their clients and should not be used in the child.
+    """
+    for module_name in _HTTPX_CLIENT_CACHE_MODULES:
+        if (module := sys.modules.get(module_name)) is None:
+            continue
+        for name, obj in vars(module).items():
+            if "httpx_client" in name and hasattr(obj, "cache_clear"):
+                obj.cache_clear()
+
+    for callback in _AFTER_FORK_CALLBACKS:
+        try:
+            callback()
+        except Exception:
+            logger.exception(f"after fork callback {callback!r} failed")
+
+
+register_after_fork(fallback._reset_locks_after_fork)
+
+if hasattr(os, "register_at_fork"):  # not available on Windows
+    os.register_at_fork(before=prepare_for_fork, after_in_child=after_fork)
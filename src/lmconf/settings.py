@@ -1,9 +1,11 @@
-from typing import Dict, List, Optional, Union
+import json
+from typing import Dict, List, Optional, Tuple, Union
 
-from pydantic import BaseModel, Field
-from typing_extensions import TypedDict
+from pydantic import BaseModel, BeforeValidator, Field, PrivateAttr, field_validator
+from typing_extensions import Annotated, TypedDict
 
 from lmconf.config import LLMConfBase, OpenAICompatibleLLMConf
+from lmconf.fallback import FallbackChain, TierSelector
 from lmconf.llm_configs.azure_openai import AzureOpenAILLMConf
 from lmconf.llm_configs.tongyi import TongyiLLMConf
 
@@ -16,18 +18,143 @@ class NamedLLMConf(TypedDict):
     )
 
 
+def _decode_json_str(value):
+    # pydantic-settings does not JSON-decode nested env values of union types,
+    # e.g. `{env_prefix}lm_config__x__chatbot='["local"]'`
+    if isinstance(value, str):
+        try:
+            return json.loads(value)
+        except ValueError:
+            pass
+    return value
+
+
+NamedFunctionality = Annotated[
+    Union[List[str], FallbackChain], BeforeValidator(_decode_json_str)
+]
+
+
+def _counting_changes(method):
+    def counted(self, *args, **kwargs):
+        self.version += 1
+        return method(self, *args, **kwargs)
+
+    return counted
+
+
+class ConfigList(list):
+    """
+    The `config_list` of `LMConfig`, which counts its changes so the index by name is
+    rebuilt when entries are added, removed or replaced. Entries themselves must be
+    replaced rather than updated in place.
+    """
+
+    version = 0
+
+    __setitem__ = _counting_changes(list.__setitem__)
+    __delitem__ = _counting_changes(list.__delitem__)
+    __iadd__ = _counting_changes(list.__iadd__)
+    __imul__ = _counting_changes(list.__imul__)
+    append = _counting_changes(list.append)
+    clear = _counting_changes(list.clear)
+    extend = _counting_changes(list.extend)
+    insert = _counting_changes(list.insert)
+    pop = _counting_changes(list.pop)
+    remove = _counting_changes(list.remove)
+    reverse = _counting_changes(list.reverse)
+    sort = _counting_changes(list.sort)
+
+
 class LMConfig(BaseModel):
-    x: Dict[str, List[str]] = Field(default_factory=dict)
+    x: Dict[str, NamedFunctionality] = Field(default_factory=dict)
     config_list: List[NamedLLMConf] = Field(default_factory=list)
 
-    def get(
+    _tier_selector: TierSelector = PrivateAttr(default_factory=TierSelector)
+
+    _conf_index: Optional[Dict[str, LLMConfBase]] = PrivateAttr(default=None)
+    # the indexed list and its version, a reference rather than an id which is reused
+    _conf_index_key: Optional[Tuple[ConfigList, int]] = PrivateAttr(default=None)
+
+    @field_validator("config_list", mode="after")
+    @classmethod
+    def count_config_list_changes(cls, config_list: List[NamedLLMConf]):
+        return ConfigList(config_list)
+
+    def __setattr__(self, name: str, value) -> None:
+        if name == "config_list" and not isinstance(value, ConfigList):
+            value = ConfigList(value)
+        super().__setattr__(name, value)
+
+    def __eq__(self, other: object) -> bool:
+        # the private attributes are the tier state and caches, not part of the value
+        if not isinstance(other, LMConfig):
+            return NotImplemented
+        return type(self) is type(other) and all(
+            getattr(self, name) == getattr(other, name)
+            for name in type(self).model_fields
+        )
+
+    def build_index(self) -> Dict[str, LLMConfBase]:
+        """
+        Returns the index of `config_list` by name, building it if `config_list` was
+        replaced or changed since the last call.
+
+        When several configurations have the same name, the first one is indexed.
+        """
+        config_list = self.config_list
+        if not isinstance(config_list, ConfigList):  # e.g. `model_construct`
+            config_list = self.config_list = ConfigList(config_list)
+        index_key = self._conf_index_key
+        if (
+            self._conf_index is None
+            or index_key is None
+            or index_key[0] is not config_list
+            or index_key[1] != config_list.version
+        ):
+            conf_index: Dict[str, LLMConfBase] = {}
+            for named_conf in config_list:
+                conf_index.setdefault(named_conf["name"], named_conf["conf"])
+            self._conf_index = conf_index
+            self._conf_index_key = (config_list, config_list.version)
+        return self._conf_index
+
+    def active_tier(self, named_functionality: str) -> Optional[int]:
+        """Returns the active tier of a functionality, None without `FallbackChain`."""
+        chain = self.x.get(named_functionality)
+        if isinstance(chain, FallbackChain):
+            return self._tier_selector.active_tier(named_functionality, chain)
+        return None
+
+    def observe_latency(
+        self, named_functionality: str, latency_s: float, tier: Optional[int] = None
+    ) -> None:
+        """
+        Records a call latency, for a functionality with a `FallbackChain`. When `tier`
+        is given, the latency is dropped unless it is still the active tier.
+        """
+        chain = self.x.get(named_functionality)
+        if isinstance(chain, FallbackChain):
+            self._tier_selector.observe_latency(
+                named_functionality, chain, latency_s, tier
+            )
+
+    def observe_queue_depth(self, named_functionality: str, queue_depth: int) -> None:
+        """Records the calls waiting, for a functionality with a `FallbackChain`."""
+        chain = self.x.get(named_functionality)
+        if isinstance(chain, FallbackChain):
+            self._tier_selector.observe_queue_depth(
+                named_functionality, chain, queue_depth
+            )
+
+    def resolve(
         self,
         named_functionality: Optional[str] = None,
         named_config: Optional[str] = None,
         which_model: Optional[str] = None,
-    ) -> LLMConfBase:
+    ) -> Tuple[str, Optional[str]]:
         """
-        Retrieves a specific LLMs configuration object based on the provided parameters.
+        Resolves the name of the LLMs configuration and the model to use, based on the
+        provided parameters.
 
         Args:
             named_functionality (Optional[str]): The name of the functionality, optional.
@@ -35,7 +162,8 @@ class LMConfig(BaseModel):
             which_model (Optional[str]): The name of the model, optional.
 
         Returns:
-            LLMConfBase: A base configuration object representing the large language model's configuration.
+            Tuple[str, Optional[str]]: The name of the LLMs configuration, and the name
+                of the model, None to use the configured model.
 
         Raises:
             ValueError: If neither `named_functionality` nor `named_config` are specified.
@@ -52,14 +180,50 @@ class LMConfig(BaseModel):
                 raise ValueError(f"{named_functionality} not found in lm_config.x")
 
             determined_llm = self.x[named_functionality]
+            # Use the active tier of a fallback chain, selected by the observed load.
+            if isinstance(determined_llm, FallbackChain):
+                tier = self._tier_selector.active_tier(
+                    named_functionality, determined_llm
+                )
+                determined_llm = determined_llm.tiers[tier]
             # Parse the config information; if only functionality name is given, default config and model are None.
             named_config, which_model = (
                 (determined_llm[0], None) if len(determined_llm) < 2 else determined_llm
             )
 
-        # Filter the config list by named_config to obtain the matching configuration object.
-        filter_ = filter(lambda d: d["name"] == named_config, self.config_list)
-        default_llm_conf = list(filter_)[0]["conf"]
+        return named_config, which_model  # type: ignore[return-value]
+
+    def get(
+        self,
+        named_functionality: Optional[str] = None,
+        named_config: Optional[str] = None,
+        which_model: Optional[str] = None,
+    ) -> LLMConfBase:
+        """
+        Retrieves a specific LLMs configuration object based on the provided parameters.
+
+        Args:
+            named_functionality (Optional[str]): The name of the functionality, optional.
+            named_config (Optional[str]): The name of the LLMs configuration, optional.
+            which_model (Optional[str]): The name of the model, optional.
+
+        Returns:
+            LLMConfBase: A base configuration object representing the large language model's configuration.
+
+        Raises:
+            ValueError: If neither `named_functionality` nor `named_config` are specified.
+            ValueError: If `named_functionality` does not exist in the configuration.
+            ValueError: If `named_config` does not exist in the configuration.
+        """
+        named_config, which_model = self.resolve(
+            named_functionality, named_config, which_model
+        )
+
+        # Look up the config list by named_config to obtain the matching configuration object.
+        conf_index = self.build_index()
+        if named_config not in conf_index:
+            raise ValueError(f"{named_config} not found in lm_config.config_list")
+        default_llm_conf = conf_index[named_config]
 
         # If which_model is not specified, return the default configuration object.
         if not which_model:
@@ -0,0 +1,291 @@
+import asyncio
+import threading
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    Generic,
+    Hashable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    TypeVar,
+)
+
+T = TypeVar("T")
+
+
+class _Call(Generic[T]):
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Optional[T] = None
+        self.exception: Optional[BaseException] = None
+
+
+class _Tee(Generic[T]):
+    """
+    Iterates the source once and replays the items to any number of consumers.
+
+    The source is created lazily, and advanced by whichever consumer needs an item
+    that nobody pulled yet, so consumers may start late or stop early. When the last
+    consumer stops before the end, the source is closed and no consumer can join.
+    """
+
+    def __init__(self, source_factory: Callable[[], Iterator[T]], on_done: Callable):
+        self._source_factory = source_factory
+        self._source: Optional[Iterator[T]] = None
+        self._on_done = on_done
+        self._items: List[T] = []
+        self._done = False
+        self._exception: Optional[BaseException] = None
+        self._consumers = 0
+        self._closed = False
+        # not held while advancing the source, so consumers can join meanwhile
+        self._consumers_lock = threading.Lock()
+        self._lock = threading.Lock()
+
+    def join(self) -> bool:
+        """Adds a consumer, returns False when the tee was closed."""
+        with self._consumers_lock:
+            if self._closed:
+                return False
+            self._consumers += 1
+            return True
+
+    def leave(self) -> None:
+        with self._consumers_lock:
+            self._consumers -= 1
+            if self._consumers or self._done:
+                return
+            self._closed = True
+            source, self._source = self._source, None
+        try:
+            close = getattr(source, "close", None)
+            if close is not None:
+                close()
+        finally:
+            self._on_done()
+
+    def __iter__(self) -> Iterator[T]:
+        i = 0
+        while True:
+            if i < len(self._items):
+                yield self._items[i]
+                i += 1
+                continue
+            with self._lock:
+                if i < len(self._items):
+                    continue
+                if self._done:
+                    if self._exception is not None:
+                        raise self._exception
+                    return
+                try:
+                    if self._source is None:
+                        self._source = self._source_factory()
+                    self._items.append(next(self._source))
+                    continue
+                except StopIteration:
+                    self._done = True
+                except BaseException as exc:
+                    self._done, self._exception = True, exc
+            self._on_done()
+
+
+class _AsyncTee(Generic[T]):
+    """
+    `_Tee` for asynchronous iterators, consumers must share the event loop.
+
+    The source is iterated by a task, so cancelling a consumer does not interrupt it.
+    """
+
+    def __init__(
+        self, source_factory: Callable[[], AsyncIterator[T]], on_done: Callable
+    ):
+        self._source_factory = source_factory
+        self._task: Optional["asyncio.Task"] = None
+        self._on_done = on_done
+        self._items: List[T] = []
+        self._done = False
+        self._exception: Optional[BaseException] = None
+        self._consumers = 0
+        self._closed = False
+        self._changed = asyncio.Event()
+
+    def join(self) -> bool:
+        """Adds a consumer, returns False when the tee was closed."""
+        if self._closed:
+            return False
+        self._consumers += 1
+        return True
+
+    def leave(self) -> None:
+        self._consumers -= 1
+        if self._consumers or self._done:
+            return
+        self._closed = True
+        if self._task is not None:
+            self._task.cancel()
+        self._on_done()
+
+    def _notify(self) -> None:
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    async def _pump(self) -> None:
+        source = self._source_factory()
+        try:
+            async for item in source:
+                self._items.append(item)
+                self._notify()
+        except asyncio.CancelledError:
+            raise
+        except BaseException as exc:
+            # raised to the consumers, not by the task
+            self._exception = exc
+        finally:
+            self._done = True
+            self._notify()
+            aclose = getattr(source, "aclose", None)
+            try:
+                if aclose is not None:
+                    await aclose()
+            finally:
+                self._on_done()
+
+    async def __aiter__(self) -> AsyncIterator[T]:
+        i = 0
+        while True:
+            if i < len(self._items):
+                yield self._items[i]
+                i += 1
+                continue
+            if self._done:
+                if self._exception is not None:
+                    raise self._exception
+                return
+            if self._task is None:
+                self._task = asyncio.ensure_future(self._pump())
+            await self._changed.wait()
+
+
+class SingleFlight:
+    """
+    Deduplicates identical in-flight calls across threads: while a call with a key
+    is running, calls with the same key wait for it and get its result (or its
+    exception) instead of running again. Finished calls are not cached.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self) -> None:
+        """Forgets the in-flight calls, e.g. in a forked child process."""
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self._streams: Dict[Hashable, _Tee] = {}
+
+    def do(self, key: Hashable, fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if call is None:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+            if call.exception is not None:
+                raise call.exception
+            return call.result  # type: ignore[return-value]
+
+        try:
+            call.result = fn(*args, **kwargs)
+            return call.result
+        except BaseException as exc:
+            call.exception = exc
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def stream(
+        self, key: Hashable, fn: Callable[..., Iterator[T]], *args: Any, **kwargs: Any
+    ) -> Iterator[T]:
+        """
+        Like `do` for calls returning an iterator, every consumer gets all the items
+        from the start, including the consumers joining while it is being iterated.
+        """
+        with self._lock:
+            tee = self._streams.get(key)
+            if tee is None or not tee.join():
+                tee = self._streams[key] = _Tee(
+                    lambda: fn(*args, **kwargs), lambda: self._forget_stream(key, tee)
+                )
+                tee.join()
+        try:
+            yield from tee
+        finally:
+            tee.leave()
+
+    def _forget_stream(self, key: Hashable, tee: Optional[_Tee]) -> None:
+        with self._lock:
+            if self._streams.get(key) is tee:
+                del self._streams[key]
+
+
+class AsyncSingleFlight:
+    """`SingleFlight` for coroutines, calls are deduplicated per event loop."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self) -> None:
+        """Forgets the in-flight calls, e.g. in a forked child process."""
+        self._tasks: Dict[Tuple[int, Hashable], "asyncio.Future"] = {}
+        self._streams: Dict[Tuple[int, Hashable], _AsyncTee] = {}
+
+    async def do(
+        self, key: Hashable, fn: Callable[..., Awaitable[T]], *args: Any, **kwargs: Any
+    ) -> T:
+        loop_key = (id(asyncio.get_running_loop()), key)
+        task = self._tasks.get(loop_key)
+        if task is None:
+            task = self._tasks[loop_key] = asyncio.ensure_future(fn(*args, **kwargs))
+            task.add_done_callback(lambda t: self._forget_task(loop_key, t))
+        # cancelling a waiter must not cancel the call of the other waiters
+        return await asyncio.shield(task)
+
+    def _forget_task(self, loop_key: Tuple[int, Hashable], task: "asyncio.Future"):
+        if self._tasks.get(loop_key) is task:
+            del self._tasks[loop_key]
+        if not task.cancelled():
+            task.exception()  # retrieved by the waiters, if any are left
+
+    async def stream(
+        self,
+        key: Hashable,
+        fn: Callable[..., AsyncIterator[T]],
+        *args: Any,
+        **kwargs: Any,
+    ) -> AsyncIterator[T]:
+        """`SingleFlight.stream` for asynchronous iterators."""
+        loop_key = (id(asyncio.get_running_loop()), key)
+        tee = self._streams.get(loop_key)
+        if tee is None or not tee.join():
+            tee = self._streams[loop_key] = _AsyncTee(
+                lambda: fn(*args, **kwargs), lambda: self._forget_stream(loop_key, tee)
+            )
+            tee.join()
+        try:
+            async for item in tee:
+                yield item
+        finally:
+            tee.leave()
+
+    def _forget_stream(self, loop_key: Tuple[int, Hashable], tee: Optional[_AsyncTee]):
+        if self._streams.get(loop_key) is tee:
+            del self._streams[loop_key]
@@ -0,0 +1,39 @@
+import json
+from pathlib import Path
+from typing import Any, Dict, Union
+
+from lmconf.settings import LMConfig
+
+SNAPSHOT_VERSION = 1
+
+
+def is_snapshot(data: Any) -> bool:
+    return isinstance(data, dict) and data.get("lmconf_snapshot") == SNAPSHOT_VERSION
+
+
+def write_snapshot(
+    path: Union[str, Path], source: Any, lm_config: Dict[str, Any]
+) -> None:
+    """
+    Writes the `lm_config` value read from the environment, and its validated form.
+    The source is kept to diff the next version against it.
+    """
+    snapshot = {
+        "lmconf_snapshot": SNAPSHOT_VERSION,
+        "source": source,
+        "lm_config": lm_config,
+    }
+    Path(path).write_text(json.dumps(snapshot, indent=2), encoding="utf-8")
+
+
+def load_snapshot(path: Union[str, Path]) -> LMConfig:
+    """
+    Loads the `lm_config` of a snapshot written by `python -m lmconf`, without reading
+    and decoding the environment, e.g.
+
+        settings = Settings(lm_config=load_snapshot("lm_config.snapshot.json"))
+    """
+    snapshot = json.loads(Path(path).read_text(encoding="utf-8"))
+    if not is_snapshot(snapshot):
+        raise ValueError(f"{path} is not a lmconf snapshot")
+    return LMConfig.model_validate(snapshot["lm_config"])
@@ -0,0 +1,391 @@
+import atexit
+import json
+import sqlite3
+import threading
+import time
+import weakref
+from logging import getLogger
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Protocol, Tuple, Union
+from uuid import UUID
+
+from typing_extensions import TypedDict
+
+try:
+    from langchain_core.callbacks import BaseCallbackHandler
+    from langchain_core.outputs import LLMResult
+except ImportError as exc:
+    raise ImportError(
+        "Could not import langchain_core python package. "
+        "Please install it with `pip install lmconf[langchain]`."
+    ) from exc
+
+from lmconf.fork import register_after_fork
+from lmconf.settings import LMConfig
+
+logger = getLogger(__name__)
+
+# (functionality, named_config, model)
+UsageKey = Tuple[Optional[str], str, str]
+# calls, errors, prompt_tokens, completion_tokens, latency_s
+_Counters = List[Union[int, float]]
+_N_COUNTERS = 5
+
+
+class UsageRecord(TypedDict):
+    functionality: Optional[str]
+    named_config: str
+    model: str
+    calls: int
+    errors: int
+    prompt_tokens: int
+    completion_tokens: int
+    latency_s: float
+    period_start: float
+    period_end: float
+
+
+class UsageSink(Protocol):
+    def write(self, records: List[UsageRecord]) -> None: ...
+
+
+class JSONLinesSink:
+    """Appends the usage records to a file, one JSON object per line."""
+
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+
+    def write(self, records: List[UsageRecord]) -> None:
+        with self.path.open("a", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record) + "\n")
+
+
+class SQLiteSink:
+    """Inserts the usage records into the `table` of a SQLite database."""
+
+    def __init__(self, path: Union[str, Path], table: str = "lmconf_usage"):
+        self.path = str(path)
+        self.table = table
+        with sqlite3.connect(self.path) as conn:
+            conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {table} ("
+                "functionality TEXT, named_config TEXT NOT NULL, model TEXT NOT NULL, "
+                "calls INTEGER, errors INTEGER, prompt_tokens INTEGER, "
+                "completion_tokens INTEGER, latency_s REAL, period_start REAL, "
+                "period_end REAL)"
+            )
+        conn.close()
+
+    def write(self, records: List[UsageRecord]) -> None:
+        with sqlite3.connect(self.path) as conn:
+            conn.executemany(
+                f"INSERT INTO {self.table} VALUES ("
+                ":functionality, :named_config, :model, :calls, :errors, "
+                ":prompt_tokens, :completion_tokens, :latency_s, :period_start, "
+                ":period_end)",
+                records,
+            )
+        conn.close()
+
+
+class _ThreadCounters:
+    def __init__(self) -> None:
+        self.thread = weakref.ref(threading.current_thread())
+        self.counters: Dict[UsageKey, _Counters] = {}
+        # counters at the previous flush
+        self.flushed: Dict[UsageKey, Tuple[Union[int, float], ...]] = {}
+
+    def is_alive(self) -> bool:
+        thread = self.thread()
+        return thread is not None and thread.is_alive()
+
+
+class UsageAggregator:
+    """
+    Aggregates the usage of LLMs in process, and periodically flushes it to a sink.
+
+    Each thread records into its own counters, so recording takes no lock. Counters
+    only grow, `flush` writes the difference since the previous flush, and drops the
+    counters of the threads which finished.
+    """
+
+    def __init__(self, sink: Optional[UsageSink] = None):
+        self.sink = sink
+        self._interval = 60.0
+        self._thread: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+        self._reset()
+        _AGGREGATORS.add(self)
+
+    def _reset(self) -> None:
+        self._lock = threading.Lock()  # held when adding threads and flushing
+        self._local = threading.local()
+        self._threads: List[_ThreadCounters] = []
+        self._flushed_at = time.time()
+
+    def record(
+        self,
+        key: UsageKey,
+        prompt_tokens: int = 0,
+        completion_tokens: int = 0,
+        latency_s: float = 0.0,
+        error: bool = False,
+    ) -> None:
+        try:
+            counters = self._local.counters
+        except AttributeError:
+            thread_counters = _ThreadCounters()
+            counters = self._local.counters = thread_counters.counters
+            with self._lock:
+                self._threads.append(thread_counters)
+        if (stats := counters.get(key)) is None:
+            stats = counters[key] = [0] * _N_COUNTERS
+        stats[0] += 1
+        stats[1] += error
+        stats[2] += prompt_tokens
+        stats[3] += completion_tokens
+        stats[4] += latency_s
+
+    def collect(self) -> List[UsageRecord]:
+        """Returns the usage recorded since the previous call, summed over threads."""
+        with self._lock:
+            start, end = self._flushed_at, time.time()
+            totals: Dict[UsageKey, List[Union[int, float]]] = {}
+            alive = []
+            for thread_counters in self._threads:
+                # checked first, a finished thread records nothing after its last delta
+                is_alive = thread_counters.is_alive()
+                for key, stats in list(thread_counters.counters.items()):
+                    current = tuple(stats)
+                    previous = thread_counters.flushed.get(key, (0,) * _N_COUNTERS)
+                    thread_counters.flushed[key] = current
+                    total = totals.setdefault(key, [0] * _N_COUNTERS)
+                    for i in range(_N_COUNTERS):
+                        total[i] += current[i] - previous[i]
+                if is_alive:
+                    alive.append(thread_counters)
+            self._threads = alive
+            self._flushed_at = end
+
+        return [
+            UsageRecord(
+                functionality=functionality,
+                named_config=named_config,
+                model=model,
+                calls=int(total[0]),
+                errors=int(total[1]),
+                prompt_tokens=int(total[2]),
+                completion_tokens=int(total[3]),
+                latency_s=total[4],
+                period_start=start,
+                period_end=end,
+            )
+            for (functionality, named_config, model), total in totals.items()
+            if total[0]
+        ]
+
+    def flush(self) -> None:
+        """Writes the usage recorded since the previous flush to the sink."""
+        records = self.collect()
+        if records and self.sink is not None:
+            self.sink.write(records)
+
+    def start(self, interval: float = 60.0) -> None:
+        """Starts flushing every `interval` seconds in a daemon thread."""
+        if self._thread is not None:
+            return
+        self._interval = interval
+        self._stop_event.clear()
+        self._thread = threading.Thread(
+            target=self._run, args=(interval,), name="lmconf-usage", daemon=True
+        )
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def stop(self) -> None:
+        """Stops the flushing thread, then flushes what is left."""
+        if self._thread is not None:
+            self._stop_event.set()
+            self._thread.join()
+            self._thread = None
+            atexit.unregister(self.stop)
+        self.flush()
+
+    def _run(self, interval: float) -> None:
+        while not self._stop_event.wait(interval):
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("failed to flush the usage of LLMs")
+
+    def _after_fork(self) -> None:
+        # the parent flushes what it recorded, the flushing thread is not running
+        was_started = self._thread is not None
+        self._thread = None
+        self._stop_event = threading.Event()
+        self._reset()
+        if was_started:
+            atexit.unregister(self.stop)
+            self.start(self._interval)
+
+
+_AGGREGATORS: "weakref.WeakSet[UsageAggregator]" = weakref.WeakSet()
+default_aggregator = UsageAggregator()
+
+
+@register_after_fork
+def _reset_aggregators() -> None:
+    for aggregator in list(_AGGREGATORS):
+        aggregator._after_fork()
+
+
+def _token_usage(response: LLMResult) -> Tuple[int, int]:
+    token_usage = (response.llm_output or {}).get("token_usage")
+    if token_usage:
+        return (
+            token_usage.get("prompt_tokens", 0) or 0,
+            token_usage.get("completion_tokens", 0) or 0,
+        )
+
+    prompt_tokens = completion_tokens = 0
+    for generations in response.generations:
+        for generation in generations:
+            usage_metadata = getattr(
+                getattr(generation, "message", None), "usage_metadata", None
+            )
+            if usage_metadata:
+                prompt_tokens += usage_metadata.get("input_tokens", 0)
+                completion_tokens += usage_metadata.get("output_tokens", 0)
+    return prompt_tokens, completion_tokens
+
+
+class UsageCallbackHandler(BaseCallbackHandler):
+    """Records the tokens, latency and errors of the LLM calls into an aggregator."""
+
+    # record in the calling thread, instead of an executor for async calls
+    run_inline = True
+
+    def __init__(
+        self,
+        key: UsageKey,
+        aggregator: Optional[UsageAggregator] = None,
+        on_latency: Optional[Callable[[float], None]] = None,
+    ):
+        self.key = key
+        self.aggregator = aggregator or default_aggregator
+        self.on_latency = on_latency
+        # start time, key and tier of the calls in progress
+        self._runs: Dict[UUID, Tuple[float, UsageKey, Optional[int]]] = {}
+
+    def _resolve(self) -> Tuple[UsageKey, Optional[int]]:
+        """Returns the key of a new call, and the tier of the functionality it uses."""
+        return self.key, None
+
+    def _observe_latency(self, latency_s: float, tier: Optional[int]) -> None:
+        if self.on_latency is not None:
+            self.on_latency(latency_s)
+
+    def _start(self, run_id: UUID) -> None:
+        self._runs[run_id] = (time.perf_counter(), *self._resolve())
+
+    def _end(
+        self,
+        run_id: UUID,
+        prompt_tokens: int = 0,
+        completion_tokens: int = 0,
+        error: bool = False,
+    ) -> None:
+        if (run := self._runs.pop(run_id, None)) is not None:
+            started_at, key, tier = run
+            latency_s = time.perf_counter() - started_at
+        else:
+            (key, tier), latency_s = self._resolve(), 0.0
+        self.aggregator.record(key, prompt_tokens, completion_tokens, latency_s, error)
+        self._observe_latency(latency_s, tier)
+
+    def on_llm_start(self, serialized: Any, prompts: Any, *, run_id: UUID, **kwargs):
+        self._start(run_id)
+
+    def on_chat_model_start(
+        self, serialized: Any, messages: Any, *, run_id: UUID, **kwargs
+    ):
+        self._start(run_id)
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs):
+        self._end(run_id, *_token_usage(response))
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs):
+        self._end(run_id, error=True)
+
+
+class _FunctionalityUsageCallbackHandler(UsageCallbackHandler):
+    """
+    Resolves the tier of a functionality at the start of each call, `key` is the key
+    of the latest call.
+    """
+
+    def __init__(
+        self,
+        lm_config: LMConfig,
+        named_functionality: str,
+        named_config: Optional[str],
+        which_model: Optional[str],
+        aggregator: Optional[UsageAggregator],
+    ):
+        self.lm_config = lm_config
+        self._args = (named_functionality, named_config, which_model)
+        super().__init__(_resolve_key(lm_config, *self._args), aggregator)
+
+    def _resolve(self) -> Tuple[UsageKey, Optional[int]]:
+        # the tier first, a call tagged with a tier changed meanwhile is not observed
+        tier = self.lm_config.active_tier(self._args[0])
+        self.key = _resolve_key(self.lm_config, *self._args)
+        return self.key, tier
+
+    def _observe_latency(self, latency_s: float, tier: Optional[int]) -> None:
+        self.lm_config.observe_latency(self._args[0], latency_s, tier)
+
+
+def _resolve_key(
+    lm_config: LMConfig,
+    named_functionality: Optional[str],
+    named_config: Optional[str],
+    which_model: Optional[str],
+) -> UsageKey:
+    named_config, which_model = lm_config.resolve(
+        named_functionality, named_config, which_model
+    )
+    model = which_model or lm_config.get(named_config=named_config).model
+    return named_functionality, named_config, model
+
+
+def track_usage(
+    lm_config: LMConfig,
+    named_functionality: Optional[str] = None,
+    named_config: Optional[str] = None,
+    which_model: Optional[str] = None,
+    aggregator: Optional[UsageAggregator] = None,
+) -> UsageCallbackHandler:
+    """
+    Returns a LangChain callback handler recording the usage of the LLMs configuration
+    that `lm_config.get(...)` returns for the same parameters. The latencies are also
+    observed by `lm_config`, to select the tier of a functionality with a fallback
+    chain, e.g.
+
+        handler = track_usage(settings.lm_config, "rag")
+        llm = settings.lm_config.get("rag").create_langchain_chatmodel(
+            callbacks=[handler]
+        )
+
+    The tier is resolved at the start of each call, so create the model again with
+    `lm_config.get(...)` for each request to follow the tier changes.
+    """
+    if named_functionality:
+        return _FunctionalityUsageCallbackHandler(
+            lm_config, named_functionality, named_config, which_model, aggregator
+        )
+    return UsageCallbackHandler(
+        _resolve_key(lm_config, named_functionality, named_config, which_model),
+        aggregator,
+    )
@@ -0,0 +1,121 @@
+import json
+
+import pytest
+
+from lmconf import cli
+from lmconf.cli import main
+from lmconf.snapshot import load_snapshot
+
+AZURE_US = {
+    "name": "azure_us",
+    "conf": {
+        "provider": "azure_openai",
+        "model": "gpt-35-turbo",
+        "api_version": "2024-02-15-preview",
+        "base_url": "https://us.example.com",
+        "api_key": "sk-1234",
+    },
+}
+LOCAL = {"name": "local", "conf": {"provider": "ollama", "model": "tinyllama"}}
+X = {"chatbot": ["local"], "rag": ["azure_us", "gpt-4"]}
+
+
+def write_env(path, config_list, x):
+    path.write_text(
+        f"LMCONF_lm_config__config_list='{json.dumps(config_list)}'\n"
+        f"LMCONF_lm_config__x='{json.dumps(x)}'\n"
+    )
+    return str(path)
+
+
+def test_validate(tmp_path, capsys):
+    env_file = write_env(tmp_path / ".env", [AZURE_US, LOCAL], X)
+    assert main(["validate", env_file]) == 0
+    assert capsys.readouterr().out == "validated 4 of 4 entries\n"
+
+    dump = tmp_path / "env.json"
+    dump.write_text(
+        json.dumps({"MYAPP_LM_CONFIG": json.dumps({"config_list": [LOCAL], "x": X})})
+    )
+    assert main(["validate", str(dump)]) == 1
+    assert capsys.readouterr().err == (
+        "error: x.rag: azure_us not found in lm_config.config_list\n"
+    )
+
+
+def test_validate_errors(tmp_path, capsys):
+    unnamed = {"conf": {"provider": "ollama", "model": "tinyllama"}}
+    env_file = write_env(tmp_path / ".env", [unnamed, LOCAL, LOCAL], X)
+    assert main(["validate", env_file, "--env-prefix", "lmconf_"]) == 1
+    err = capsys.readouterr().err.splitlines()
+    assert "error: config_list[0]: name: Field required" in err
+
+    # accepted at runtime, which uses the first entry
+    env_file = write_env(tmp_path / ".env", [AZURE_US, LOCAL, LOCAL], X)
+    assert main(["validate", env_file]) == 0
+    assert capsys.readouterr().err == (
+        "warning: lm_config.config_list: duplicate name local, "
+        "the first entry is used\n"
+    )
+    env_file = write_env(tmp_path / ".env", [AZURE_US, LOCAL, {"name": "local"}], X)
+    assert main(["validate", env_file]) == 1
+    assert "error: config_list[2]: conf: Field required" in (
+        capsys.readouterr().err.splitlines()
+    )
+
+    (tmp_path / "empty.env").write_text("FOO=bar\n")
+    assert main(["validate", str(tmp_path / "empty.env")]) == 1
+    assert capsys.readouterr().err == "error: no lm_config variables found\n"
+
+
+def test_diff(tmp_path, capsys, monkeypatch):
+    old = write_env(tmp_path / "old.env", [AZURE_US, LOCAL], X)
+    azure_us = {**AZURE_US, "conf": {**AZURE_US["conf"], "model": "gpt-4"}}
+    zhipu = {"name": "zhipu", "conf": {"provider": "zhipu", "model": "glm-4"}}
+    new = write_env(
+        tmp_path / "new.env", [azure_us, zhipu], {**X, "summary": ["zhipu"]}
+    )
+
+    validated = []
+    validate_python = cli._NAMED_CONF_ADAPTER.validate_python
+
+    def validate_conf(entry):
+        validated.append(entry["name"])
+        return validate_python(entry)
+
+    monkeypatch.setattr(cli._NAMED_CONF_ADAPTER, "validate_python", validate_conf)
+    assert main(["diff", old, new]) == 1
+    assert sorted(validated) == ["azure_us", "zhipu"]
+    out, err = capsys.readouterr()
+    assert out.splitlines() == [
+        "config_list: 1 added, 1 changed, 1 removed",
+        "  + zhipu",
+        "  ~ azure_us",
+        "  - local",
+        "x: 1 added, 0 changed, 0 removed",
+        "  + summary",
+        "  ~ chatbot (via local)",
+        "  ~ rag (via azure_us)",
+        "validated 3 of 5 entries",
+    ]
+    assert err == "error: x.chatbot: local not found in lm_config.config_list\n"
+
+
+def test_snapshot(tmp_path, capsys):
+    old = write_env(tmp_path / "old.env", [AZURE_US, LOCAL], X)
+    snapshot = tmp_path / "snapshot.json"
+    assert main(["validate", old, "--snapshot", str(snapshot)]) == 0
+    lm_config = load_snapshot(snapshot)
+    assert lm_config.get("rag").model == "gpt-4"
+
+    # the unchanged entries are taken from the snapshot
+    new = write_env(tmp_path / "new.env", [AZURE_US, LOCAL], {**X, "rag": ["local"]})
+    new_snapshot = tmp_path / "new_snapshot.json"
+    assert main(["diff", str(snapshot), new, "--snapshot", str(new_snapshot)]) == 0
+    assert capsys.readouterr().out.endswith("validated 1 of 4 entries\n")
+    assert load_snapshot(new_snapshot).get("rag").model == "tinyllama"
+
+    dump = tmp_path / "env.json"
+    dump.write_text(json.dumps({"LMCONF_LM_CONFIG": "{}"}))
+    with pytest.raises(ValueError, match="not a lmconf snapshot"):
+        load_snapshot(dump)
@@ -0,0 +1,151 @@
+import copy
+import pickle
+
+import pytest
+from pydantic import ValidationError
+
+from lmconf import after_fork
+from lmconf.fallback import FallbackChain, SimulationStep, simulate
+from lmconf.settings import LMConfig
+
+TIERS = [["azure_je", "gpt-4"], ["azure_je", "gpt-35-turbo"], ["local"]]
+
+
+def test_chain_thresholds():
+    chain = FallbackChain(
+        tiers=TIERS, downgrade_p95_latency_s=8.0, downgrade_queue_depth=10
+    )
+    assert chain.upgrade_p95_latency_s == 4.0
+    assert chain.upgrade_queue_depth == 5
+
+    with pytest.raises(ValidationError, match="must not exceed"):
+        FallbackChain(
+            tiers=TIERS, downgrade_p95_latency_s=1.0, upgrade_p95_latency_s=2.0
+        )
+    with pytest.raises(ValidationError):
+        FallbackChain(tiers=[])
+
+
+def test_simulate_latency_hysteresis():
+    chain = FallbackChain(
+        tiers=TIERS,
+        downgrade_p95_latency_s=8.0,
+        window=5,
+        min_samples=5,
+        cooldown_s=10.0,
+    )
+    slow = [SimulationStep(time=t, latency_s=9.0) for t in range(5)]
+    # between the thresholds: keep the tier
+    medium = [SimulationStep(time=t, latency_s=6.0) for t in range(20, 30)]
+    fast = [SimulationStep(time=t, latency_s=1.0) for t in range(30, 35)]
+
+    tiers = simulate(chain, slow + medium + fast)
+    assert tiers == [0] * 4 + [1] + [1] * 10 + [1] * 4 + [0]
+
+
+def test_simulate_cooldown_and_last_tier():
+    chain = FallbackChain(
+        tiers=TIERS, downgrade_queue_depth=10, upgrade_queue_depth=2, cooldown_s=5.0
+    )
+    steps = [SimulationStep(time=t, queue_depth=20) for t in range(0, 20, 2)]
+    steps += [SimulationStep(time=t, queue_depth=5) for t in range(20, 30, 2)]
+    steps += [SimulationStep(time=t, queue_depth=0) for t in range(30, 50, 2)]
+
+    tiers = simulate(chain, steps)
+    # downgrade at most every 5s, down to the last tier
+    assert tiers[:10] == [1, 1, 1, 2, 2, 2, 2, 2, 2, 2]
+    assert tiers[10:15] == [2, 2, 2, 2, 2]
+    assert tiers[15:] == [1, 1, 1, 0, 0, 0, 0, 0, 0, 0]
+
+
+def test_simulate_upgrade_at_threshold():
+    # the default upgrade queue depth is 0, reached when the queue is empty
+    chain = FallbackChain(tiers=TIERS[:2], downgrade_queue_depth=1, cooldown_s=1.0)
+    steps = [
+        SimulationStep(time=0, queue_depth=5),
+        SimulationStep(time=10, queue_depth=0),
+        SimulationStep(time=20, queue_depth=0),
+    ]
+    assert simulate(chain, steps) == [1, 0, 0]
+
+
+def test_simulate_is_deterministic():
+    chain = FallbackChain(tiers=TIERS, downgrade_p95_latency_s=2.0, min_samples=3)
+    steps = [
+        SimulationStep(time=i * 0.5, latency_s=float(i % 7), queue_depth=i % 3)
+        for i in range(200)
+    ]
+    assert simulate(chain, steps) == simulate(chain, steps)
+
+
+def test_lm_config_get_active_tier():
+    lm_config = LMConfig.model_validate(
+        {
+            "config_list": [
+                {"name": "azure_je", "conf": {"provider": "openai", "model": "gpt-4"}},
+                {"name": "local", "conf": {"provider": "ollama", "model": "tinyllama"}},
+            ],
+            "x": {
+                "chatbot": ["local"],
+                "tool-use": {
+                    "tiers": TIERS,
+                    "downgrade_p95_latency_s": 8.0,
+                    "min_samples": 1,
+                },
+            },
+        }
+    )
+    assert isinstance(lm_config.x["tool-use"], FallbackChain)
+    assert lm_config.get("tool-use").model == "gpt-4"
+
+    lm_config.observe_latency("tool-use", 10.0)
+    assert lm_config.get("tool-use").model == "gpt-35-turbo"
+    assert lm_config.resolve("tool-use") == ("azure_je", "gpt-35-turbo")
+
+    # no effect on functionalities without fallback chain
+    lm_config.observe_latency("chatbot", 10.0)
+    lm_config.observe_queue_depth("chatbot", 100)
+    assert lm_config.get("chatbot").model == "tinyllama"
+
+
+def test_lm_config_copies():
+    lm_config = LMConfig.model_validate(
+        {
+            "config_list": [
+                {"name": "azure_je", "conf": {"provider": "openai", "model": "gpt-4"}}
+            ],
+            "x": {"tool-use": {"tiers": TIERS[:2], "downgrade_queue_depth": 1}},
+        }
+    )
+    lm_config.observe_queue_depth("tool-use", 2)
+
+    copies = [
+        pickle.loads(pickle.dumps(lm_config)),
+        copy.deepcopy(lm_config),
+        lm_config.model_copy(deep=True),
+    ]
+    for lm_config_copy in copies:
+        assert lm_config_copy.get("tool-use").model == "gpt-35-turbo"
+        lm_config_copy.observe_queue_depth("tool-use", 0)
+    assert lm_config.get("tool-use").model == "gpt-35-turbo"
+
+    lock = lm_config._tier_selector._lock
+    after_fork()
+    assert lm_config._tier_selector._lock is not lock
+
+
+def test_lm_config_equality():
+    data = {
+        "config_list": [
+            {"name": "azure_je", "conf": {"provider": "openai", "model": "gpt-4"}}
+        ],
+        "x": {"tool-use": {"tiers": TIERS[:2], "downgrade_queue_depth": 1}},
+    }
+    lm_config = LMConfig.model_validate(data)
+    assert lm_config == LMConfig.model_validate(data)
+    assert LMConfig.model_validate_json(lm_config.model_dump_json()) == lm_config
+
+    # the tier state is not part of the value
+    lm_config.observe_queue_depth("tool-use", 2)
+    assert lm_config == LMConfig.model_validate(data)
+    assert lm_config != LMConfig.model_validate({**data, "x": {}})
@@ -0,0 +1,105 @@
+import os
+import sys
+
+import pytest
+
+from lmconf import after_fork, env_cache_settings, prepare_for_fork
+from lmconf.fork import _AFTER_FORK_CALLBACKS, register_after_fork
+from lmconf.settings import LMConfig
+
+
+class CachedSettings:
+    def __init__(self, lm_config: LMConfig):
+        self.lm_config = lm_config
+
+
+@pytest.fixture
+def lm_config(monkeypatch: pytest.MonkeyPatch):
+    lm_config = LMConfig.model_validate(
+        {
+            "config_list": [
+                {"name": "local", "conf": {"provider": "ollama", "model": "tinyllama"}},
+                {"name": "local", "conf": {"provider": "ollama", "model": "gemma:2b"}},
+            ],
+            "x": {"chatbot": ["local"]},
+        }
+    )
+    monkeypatch.setattr(
+        env_cache_settings, "_FROM_ENV_CACHE", {0: CachedSettings(lm_config)}
+    )
+    return lm_config
+
+
+@pytest.fixture
+def after_fork_calls(monkeypatch: pytest.MonkeyPatch):
+    calls = []
+    monkeypatch.setattr(
+        "lmconf.fork._AFTER_FORK_CALLBACKS", list(_AFTER_FORK_CALLBACKS)
+    )
+    register_after_fork(lambda: calls.append(os.getpid()))
+    return calls
+
+
+def test_prepare_for_fork_builds_index(lm_config: LMConfig):
+    assert lm_config._conf_index is None
+
+    prepare_for_fork()
+    conf_index = lm_config._conf_index
+    assert conf_index is not None
+    assert conf_index["local"].model == "tinyllama"
+
+    prepare_for_fork()
+    assert lm_config._conf_index is conf_index
+
+
+def test_index_follows_config_list(lm_config: LMConfig):
+    assert lm_config.get("chatbot").model == "tinyllama"
+
+    lm_config.config_list = lm_config.config_list[1:]
+    assert lm_config.get("chatbot").model == "gemma:2b"
+
+    with pytest.raises(ValueError, match="unknown not found"):
+        lm_config.get(named_config="unknown")
+
+    # changed in place
+    gemma = {"name": "local", "conf": lm_config.get("chatbot")}
+    lm_config.config_list[0] = {**gemma, "name": "renamed"}
+    assert lm_config.get(named_config="renamed").model == "gemma:2b"
+    with pytest.raises(ValueError, match="local not found"):
+        lm_config.get("chatbot")
+
+    lm_config.config_list.append(gemma)
+    assert lm_config.get("chatbot").model == "gemma:2b"
+
+
+def test_index_does_not_change_equality(lm_config: LMConfig):
+    data = lm_config.model_dump()
+    assert lm_config.get("chatbot").model == "tinyllama"
+    assert lm_config == LMConfig.model_validate(data)
+    # a plain list, as with `model_construct`
+    assert lm_config == LMConfig.model_construct(
+        x=lm_config.x, config_list=list(lm_config.config_list)
+    )
+
+    # the change count is not part of the value either
+    lm_config.config_list.append(lm_config.config_list.pop())
+    assert lm_config.config_list.version
+    assert lm_config == LMConfig.model_validate(data)
+
+
+def test_after_fork_runs_callbacks(after_fork_calls):
+    after_fork()
+    assert after_fork_calls == [os.getpid()]
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="requires os.fork")
+def test_fork(lm_config: LMConfig, after_fork_calls):
+    pid = os.fork()
+    if pid == 0:  # child
+        ok = lm_config._conf_index is not None and after_fork_calls == [os.getpid()]
+        sys.stdout.flush()
+        os._exit(0 if ok else 1)
+
+    _, status = os.waitpid(pid, 0)
+    assert os.WEXITSTATUS(status) == 0
+    assert after_fork_calls == []
@@ -0,0 +1,301 @@
+import asyncio
+import gc
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from langchain_core.runnables import RunnableGenerator, RunnableLambda
+
+from lmconf.coalesce import CoalescedRunnable, create_coalesced_chatmodel
+from lmconf.settings import LMConfig
+from lmconf.singleflight import AsyncSingleFlight, SingleFlight
+from lmconf.usage import UsageAggregator, track_usage
+
+N_CALLERS = 8
+
+
+def test_single_flight():
+    single_flight = SingleFlight()
+    calls = []
+    started = threading.Barrier(N_CALLERS)
+
+    def call(x):
+        calls.append(x)
+        time.sleep(0.1)
+        return [x]
+
+    def caller(_):
+        started.wait()
+        return single_flight.do("key", call, 1)
+
+    with ThreadPoolExecutor(N_CALLERS) as executor:
+        results = list(executor.map(caller, range(N_CALLERS)))
+
+    assert calls == [1]
+    assert all(result is results[0] for result in results)
+
+    # finished calls are not cached
+    assert single_flight.do("key", call, 2) == [2]
+    assert calls == [1, 2]
+
+
+def test_single_flight_exception():
+    single_flight = SingleFlight()
+    started = threading.Barrier(N_CALLERS)
+
+    def call():
+        time.sleep(0.1)
+        raise RuntimeError("failed")
+
+    def caller(_):
+        started.wait()
+        with pytest.raises(RuntimeError, match="failed"):
+            single_flight.do("key", call)
+
+    with ThreadPoolExecutor(N_CALLERS) as executor:
+        list(executor.map(caller, range(N_CALLERS)))
+    assert single_flight._calls == {}
+
+
+def test_single_flight_stream():
+    single_flight = SingleFlight()
+    calls = []
+    started = threading.Barrier(N_CALLERS)
+
+    def stream():
+        calls.append(1)
+        for i in range(5):
+            time.sleep(0.01)
+            yield i
+
+    def caller(_):
+        started.wait()
+        return list(single_flight.stream("key", stream))
+
+    with ThreadPoolExecutor(N_CALLERS) as executor:
+        results = list(executor.map(caller, range(N_CALLERS)))
+
+    assert calls == [1]
+    assert results == [[0, 1, 2, 3, 4]] * N_CALLERS
+    assert single_flight._streams == {}
+
+
+def test_single_flight_stream_stopped_early():
+    single_flight = SingleFlight()
+
+    def stream():
+        yield from range(5)
+
+    first = single_flight.stream("key", stream)
+    second = single_flight.stream("key", stream)
+    assert next(first) == 0
+    first.close()
+    assert list(second) == [0, 1, 2, 3, 4]
+
+
+def test_single_flight_stream_abandoned():
+    single_flight = SingleFlight()
+    calls = []
+    closed = []
+
+    def stream():
+        calls.append(1)
+        try:
+            yield from range(5)
+        finally:
+            closed.append(1)
+
+    first = single_flight.stream("key", stream)
+    assert next(first) == 0
+    first.close()
+    assert closed == [1]
+    assert single_flight._streams == {}
+
+    # a later call is not served the chunks of the abandoned one
+    assert list(single_flight.stream("key", stream)) == [0, 1, 2, 3, 4]
+    assert calls == [1, 1]
+
+    dropped = single_flight.stream("key", stream)
+    next(dropped)
+    del dropped
+    gc.collect()
+    assert single_flight._streams == {}
+    assert closed == [1, 1, 1]
+
+
+def test_async_single_flight():
+    single_flight = AsyncSingleFlight()
+    calls = []
+
+    async def call(x):
+        calls.append(x)
+        await asyncio.sleep(0.1)
+        return [x]
+
+    async def main():
+        callers = [single_flight.do("key", call, 1) for _ in range(N_CALLERS)]
+        cancelled = asyncio.ensure_future(single_flight.do("key", call, 1))
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        return await asyncio.gather(*callers)
+
+    results = asyncio.run(main())
+    assert calls == [1]
+    assert all(result is results[0] for result in results)
+    assert single_flight._tasks == {}
+
+
+def test_async_single_flight_stream():
+    single_flight = AsyncSingleFlight()
+    calls = []
+
+    async def stream():
+        calls.append(1)
+        for i in range(5):
+            await asyncio.sleep(0.01)
+            yield i
+
+    async def consume():
+        return [i async for i in single_flight.stream("key", stream)]
+
+    async def main():
+        return await asyncio.gather(*(consume() for _ in range(N_CALLERS)))
+
+    assert asyncio.run(main()) == [[0, 1, 2, 3, 4]] * N_CALLERS
+    assert calls == [1]
+    assert single_flight._streams == {}
+
+
+def test_async_single_flight_stream_cancelled():
+    single_flight = AsyncSingleFlight()
+    calls = []
+
+    async def stream():
+        calls.append(1)
+        for i in range(5):
+            await asyncio.sleep(0.01)
+            yield i
+
+    async def consume(items):
+        async for i in single_flight.stream("key", stream):
+            items.append(i)
+
+    async def main():
+        cancelled, items = [], []
+        task = asyncio.ensure_future(consume(cancelled))
+        other = asyncio.ensure_future(consume(items))
+        while not cancelled:
+            await asyncio.sleep(0.001)
+        task.cancel()
+        await other
+        # every consumer stopped early: the next call runs again
+        first = single_flight.stream("key", stream)
+        assert await first.__anext__() == 0
+        await first.aclose()
+        await asyncio.sleep(0)
+        assert single_flight._streams == {}
+        return cancelled, items, [i async for i in single_flight.stream("key", stream)]
+
+    cancelled, items, again = asyncio.run(main())
+    assert cancelled == [0]
+    assert items == [0, 1, 2, 3, 4]
+    assert again == [0, 1, 2, 3, 4]
+    assert calls == [1, 1, 1]
+
+
+def test_coalesced_runnable():
+    calls = []
+
+    def call(input):
+        calls.append(input)
+        time.sleep(0.1)
+        return input.upper()
+
+    def stream(inputs):
+        for input in inputs:
+            calls.append(input)
+            yield from input.upper()
+
+    llm = CoalescedRunnable(RunnableLambda(call), "conf")
+    started = threading.Barrier(N_CALLERS)
+
+    def caller(input):
+        started.wait()
+        return llm.invoke(input)
+
+    inputs = ["hello"] * (N_CALLERS - 1) + ["bye"]
+    with ThreadPoolExecutor(N_CALLERS) as executor:
+        results = list(executor.map(caller, inputs))
+    assert results == ["HELLO"] * (N_CALLERS - 1) + ["BYE"]
+    assert sorted(calls) == ["bye", "hello"]
+
+    calls.clear()
+    streaming_llm = CoalescedRunnable(RunnableGenerator(stream), "conf")
+    first = streaming_llm.stream("hi")
+    second = streaming_llm.stream("hi")
+    assert next(first) == "H"
+    assert list(second) == ["H", "I"]
+    assert list(first) == ["I"]
+    assert calls == ["hi"]
+
+
+def test_coalesced_runnable_async():
+    calls = []
+
+    async def call(input):
+        calls.append(input)
+        await asyncio.sleep(0.1)
+        return input.upper()
+
+    llm = CoalescedRunnable(RunnableLambda(call), "conf")
+
+    async def main():
+        return await asyncio.gather(*(llm.ainvoke("hello") for _ in range(N_CALLERS)))
+
+    assert asyncio.run(main()) == ["HELLO"] * N_CALLERS
+    assert calls == ["hello"]
+
+
+@pytest.fixture
+def lm_config():
+    return LMConfig.model_validate(
+        {
+            "config_list": [
+                {
+                    "name": "openai",
+                    "conf": {"provider": "openai", "model": "gpt-4", "api_key": "sk-"},
+                }
+            ],
+            "x": {"chatbot": ["openai"]},
+        }
+    )
+
+
+def test_coalesced_chatmodel_with_track_usage(lm_config: LMConfig):
+    aggregator = UsageAggregator()
+
+    def create_chatmodel(**kwargs):
+        # a model and a handler per request
+        handler = track_usage(lm_config, "chatbot", aggregator=aggregator)
+        return create_coalesced_chatmodel(
+            lm_config.get("chatbot"), callbacks=[handler], **kwargs
+        )
+
+    assert create_chatmodel().key == create_chatmodel().key
+    assert create_chatmodel().key != create_chatmodel(temperature=0.5).key
+
+
+def test_coalesced_chatmodel_attributes(lm_config: LMConfig):
+    llm = create_coalesced_chatmodel(lm_config.get("chatbot"))
+    assert llm.model_name == "gpt-4"
+
+    tool = {
+        "type": "function",
+        "function": {"name": "search", "parameters": {"type": "object"}},
+    }
+    with_tools = llm.bind_tools([tool])
+    assert isinstance(with_tools, CoalescedRunnable)
+    assert with_tools.bound.kwargs["tools"] == [tool]
+    assert with_tools.key == llm.bind_tools([dict(tool)]).key
+    assert with_tools.key != llm.key
@@ -0,0 +1,180 @@
+import json
+import sqlite3
+import threading
+import uuid
+
+import pytest
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage
+
+from lmconf.fallback import FallbackChain
+from lmconf.settings import LMConfig
+from lmconf.usage import (
+    JSONLinesSink,
+    SQLiteSink,
+    UsageAggregator,
+    UsageCallbackHandler,
+    track_usage,
+)
+
+KEY = ("rag", "azure_us", "gpt-4")
+
+
+@pytest.fixture
+def lm_config():
+    return LMConfig.model_validate(
+        {
+            "config_list": [
+                {"name": "local", "conf": {"provider": "ollama", "model": "tinyllama"}},
+                {"name": "azure_us", "conf": {"provider": "openai", "model": "gpt-35"}},
+            ],
+            "x": {"chatbot": ["local"], "rag": ["azure_us", "gpt-4"]},
+        }
+    )
+
+
+def test_aggregator_collects_deltas():
+    aggregator = UsageAggregator()
+
+    def worker():
+        for _ in range(100):
+            aggregator.record(KEY, prompt_tokens=2, completion_tokens=3, latency_s=0.5)
+        aggregator.record(KEY, error=True)
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    (record,) = aggregator.collect()
+    assert record["functionality"] == "rag"
+    assert record["named_config"] == "azure_us"
+    assert record["model"] == "gpt-4"
+    assert record["calls"] == 404
+    assert record["errors"] == 4
+    assert record["prompt_tokens"] == 800
+    assert record["completion_tokens"] == 1200
+    assert record["latency_s"] == pytest.approx(200.0)
+
+    assert aggregator.collect() == []
+    aggregator.record(KEY, prompt_tokens=1)
+    (record,) = aggregator.collect()
+    assert record["calls"] == 1
+    assert record["prompt_tokens"] == 1
+
+
+def test_aggregator_drops_finished_threads():
+    aggregator = UsageAggregator()
+    for _ in range(100):
+        thread = threading.Thread(target=aggregator.record, args=(KEY,))
+        thread.start()
+        thread.join()
+    aggregator.record(KEY)
+    assert len(aggregator._threads) == 101
+
+    (record,) = aggregator.collect()
+    assert record["calls"] == 101
+    assert len(aggregator._threads) == 1
+
+    aggregator.record(KEY)
+    (record,) = aggregator.collect()
+    assert record["calls"] == 1
+
+
+def test_sinks(tmp_path):
+    jsonl_path = tmp_path / "usage.jsonl"
+    sqlite_path = tmp_path / "usage.sqlite3"
+    for sink in (JSONLinesSink(jsonl_path), SQLiteSink(sqlite_path)):
+        aggregator = UsageAggregator(sink)
+        aggregator.record(KEY, prompt_tokens=2, completion_tokens=3, latency_s=0.5)
+        aggregator.flush()
+        aggregator.record(KEY, prompt_tokens=1)
+        aggregator.start(interval=60)
+        aggregator.stop()
+
+    records = [json.loads(line) for line in jsonl_path.read_text().splitlines()]
+    assert [record["prompt_tokens"] for record in records] == [2, 1]
+
+    with sqlite3.connect(sqlite_path) as conn:
+        rows = conn.execute(
+            "SELECT functionality, calls, prompt_tokens FROM lmconf_usage"
+        ).fetchall()
+    conn.close()
+    assert rows == [("rag", 1, 2), ("rag", 1, 1)]
+
+
+def test_track_usage(lm_config: LMConfig):
+    assert track_usage(lm_config, "rag").key == ("rag", "azure_us", "gpt-4")
+    assert track_usage(lm_config, "chatbot").key == ("chatbot", "local", "tinyllama")
+    assert track_usage(lm_config, named_config="local").key == (
+        None,
+        "local",
+        "tinyllama",
+    )
+
+
+def test_callback_handler():
+    aggregator = UsageAggregator()
+    handler = UsageCallbackHandler(KEY, aggregator)
+    message = AIMessage(
+        content="Paris",
+        usage_metadata={"input_tokens": 7, "output_tokens": 2, "total_tokens": 9},
+    )
+    chat_model = GenericFakeChatModel(messages=iter([message]), callbacks=[handler])
+
+    assert chat_model.invoke("What is the capital of France?").content == "Paris"
+    with pytest.raises(Exception):
+        chat_model.invoke("no more messages")
+
+    (record,) = aggregator.collect()
+    assert record["calls"] == 2
+    assert record["errors"] == 1
+    assert record["prompt_tokens"] == 7
+    assert record["completion_tokens"] == 2
+    assert record["latency_s"] > 0
+
+
+def test_track_usage_observes_latency(lm_config: LMConfig):
+    lm_config.x["rag"] = FallbackChain(
+        tiers=[["azure_us", "gpt-4"], ["local"]],
+        downgrade_p95_latency_s=0.0,
+        min_samples=1,
+    )
+    handler = track_usage(lm_config, "rag", aggregator=UsageAggregator())
+    assert handler.key == ("rag", "azure_us", "gpt-4")
+
+    run_id = uuid.uuid4()
+    handler.on_chat_model_start({}, [], run_id=run_id)
+    handler.on_llm_error(TimeoutError(), run_id=run_id)
+    assert lm_config.resolve("rag") == ("local", None)
+
+
+def test_track_usage_follows_tier_changes(lm_config: LMConfig):
+    lm_config.x["rag"] = FallbackChain(
+        tiers=[["azure_us", "gpt-4"], ["local"]],
+        downgrade_p95_latency_s=0.0,
+        min_samples=1,
+        cooldown_s=0.0,
+    )
+    aggregator = UsageAggregator()
+    handler = track_usage(lm_config, "rag", aggregator=aggregator)
+
+    # a call sent before the downgrade ends after it
+    slow, stale = uuid.uuid4(), uuid.uuid4()
+    handler.on_chat_model_start({}, [], run_id=slow)
+    handler.on_chat_model_start({}, [], run_id=stale)
+    handler.on_llm_error(TimeoutError(), run_id=slow)
+    assert lm_config.resolve("rag") == ("local", None)
+    handler.on_llm_error(TimeoutError(), run_id=stale)
+    assert not lm_config._tier_selector._states["rag"].latencies
+
+    run_id = uuid.uuid4()
+    handler.on_chat_model_start({}, [], run_id=run_id)
+    assert handler.key == ("rag", "local", "tinyllama")
+    handler.on_llm_error(TimeoutError(), run_id=run_id)
+    assert len(lm_config._tier_selector._states["rag"].latencies) == 1
+
+    records = {record["named_config"]: record for record in aggregator.collect()}
+    assert records["azure_us"]["calls"] == 2
+    assert records["local"]["calls"] == 1